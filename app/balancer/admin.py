@@ -1,4 +1,4 @@
-from app.balancer.models import BalanceResult, BalanceAnswer
+from app.balancer.models import BalanceResult, BalanceAnswer, ExponentReport
 from django.contrib import admin
 
 
@@ -17,5 +17,11 @@ class BalanceResultAdmin(admin.ModelAdmin):
     list_display = ('id',)
 
 
+class ExponentReportAdmin(admin.ModelAdmin):
+    model = ExponentReport
+    list_display = ('id', 'date', 'matches', 'recommended')
+
+
 admin.site.register(BalanceAnswer, BalanceAnswerAdmin)
 admin.site.register(BalanceResult, BalanceResultAdmin)
+admin.site.register(ExponentReport, ExponentReportAdmin)
@@ -1,15 +1,172 @@
+import bisect
+import heapq
 import itertools
 import random
+from types import SimpleNamespace
 from typing import List
 
-from app.ladder.models import Match, Player
+from app.ladder.models import Match, Player, LadderSettings
 
 
 role_names = ['carry', 'mid', 'offlane', 'pos4', 'pos5']
 role_permutations = list(itertools.permutations(role_names, 5))
 
+# answers with mmr diff within the first of these are preferred,
+# then within the second and so on
+mmr_diff_tolerance = [200, 300, 400]
 
-def balance_teams(players, mmr_exponent=3):
+
+class BalancerPlayer:
+    """
+    Stand-in for Player that has only the fields balancer needs.
+    Used to rerun balancer without the database.
+    """
+    def __init__(self, id, name, ladder_mmr, roles):
+        self.id = id
+        self.name = name
+        self.ladder_mmr = ladder_mmr
+        self.roles = SimpleNamespace(**dict(zip(role_names, roles)))
+
+
+def rank_answers(answers, key, limit=None):
+    """
+    Sorts answers by key. With limit only the best answers are kept,
+    using a bounded heap instead of sorting all of them.
+    Result is the same as sorted(answers, key=key)[:limit].
+    """
+    if limit is None:
+        return sorted(answers, key=key)
+
+    return heapq.nsmallest(limit, answers, key=key)
+
+
+def pareto_front(answers):
+    """
+    Answers that are not dominated by any other answer by
+    role score (higher is better), exponent mmr diff and mmr diff (lower is better).
+    Answers with equal scores are all kept. Original order is preserved.
+
+    Done in one sort-and-sweep pass: answers are visited from the best
+    role score, and a staircase of (mmr_diff_exp, mmr_diff) points seen so far
+    tells if the current answer is dominated.
+    """
+    order = sorted(
+        range(len(answers)),
+        key=lambda i: (-answers[i]['role_score_sum'], answers[i]['mmr_diff_exp'], answers[i]['mmr_diff'])
+    )
+
+    # staircase points sorted by mmr_diff_exp with mmr_diff decreasing
+    diffs_exp, diffs, scores = [], [], []
+    front = []
+    for i in order:
+        a = answers[i]
+        diff_exp, diff, score = a['mmr_diff_exp'], a['mmr_diff'], a['role_score_sum']
+
+        # point with the lowest mmr_diff among ones with mmr_diff_exp <= diff_exp
+        pos = bisect.bisect_right(diffs_exp, diff_exp) - 1
+        if pos >= 0 and diffs[pos] <= diff:
+            if (diffs_exp[pos], diffs[pos], scores[pos]) == (diff_exp, diff, score):
+                front.append(i)  # same scores as an answer on the front
+            continue  # dominated
+
+        front.append(i)
+
+        # drop points that are now dominated and add the new one
+        start = pos if pos >= 0 and diffs_exp[pos] == diff_exp else pos + 1
+        end = start
+        while end < len(diffs) and diffs[end] >= diff:
+            end += 1
+        diffs_exp[start:end] = [diff_exp]
+        diffs[start:end] = [diff]
+        scores[start:end] = [score]
+
+    return [answers[i] for i in sorted(front)]
+
+
+def select_answers(answers, policy=LadderSettings.LADDER_POLICY, limit=None):
+    """
+    Picks and orders role balanced answers according to balance policy.
+
+    LADDER_POLICY: answers within the lowest mmr diff tolerance that has any,
+                   best role score first.
+    FRONT_ROLES_POLICY: Pareto front, answers within lower mmr diff tolerance
+                        first, then by best role score.
+    FRONT_MMR_POLICY: Pareto front, lowest exponent mmr diff first.
+
+    First answer of LADDER_POLICY and FRONT_ROLES_POLICY is the same.
+    """
+    def tolerance(answer):
+        return bisect.bisect_left(mmr_diff_tolerance, answer['mmr_diff'])
+
+    if policy == LadderSettings.FRONT_MMR_POLICY:
+        return rank_answers(pareto_front(answers),
+                            key=lambda x: (x['mmr_diff_exp'], -x['role_score_sum']), limit=limit)
+
+    if policy == LadderSettings.FRONT_ROLES_POLICY:
+        return rank_answers(pareto_front(answers),
+                            key=lambda x: (tolerance(x), -x['role_score_sum'], x['mmr_diff_exp']), limit=limit)
+
+    # discard answers that have too unbalanced teams
+    if answers:
+        best = min(tolerance(x) for x in answers)
+        answers = [x for x in answers if tolerance(x) == best]
+
+    return rank_answers(answers, key=lambda x: (-x['role_score_sum'], x['mmr_diff_exp']), limit=limit)
+
+
+def team_key(team):
+    """
+    Key of a team (players in slot order) for team roles cache.
+    Includes everything that affects roles assignment.
+    """
+    return tuple(
+        (p.id, p.ladder_mmr) + tuple(getattr(p.roles, r) for r in role_names)
+        for p in team
+    )
+
+
+def pair_masks(players, pairs):
+    """
+    Bitmasks over players for pairs of player ids.
+    Pairs with players not from this list are skipped.
+    """
+    index = {p.id: i for i, p in enumerate(players)}
+
+    return [
+        1 << index[a] | 1 << index[b] for a, b in pairs
+        if a in index and b in index and a != b
+    ]
+
+
+def feasible_teams(players, apart=(), together=()):
+    """
+    Checks every team against pair constraints using bitmasks over players.
+
+    :param players: list of players, in the order used to build teams
+    :param apart: pairs of player ids that can't play in one team (blacklist)
+    :param together: pairs of player ids that must play in one team (premades)
+    :return: list of bools for each team of
+             itertools.combinations(players, len(players) // 2)
+    """
+    teams = list(itertools.combinations(range(len(players)), len(players) // 2))
+
+    apart = pair_masks(players, apart)
+    together = pair_masks(players, together)
+    if not apart and not together:
+        return [True] * len(teams)
+
+    teams = [sum(1 << i for i in team) for team in teams]
+
+    # team must have exactly one player of an apart pair
+    # and both or none players of a together pair
+    return [
+        all(team & pair not in (0, pair) for pair in apart) and
+        all(team & pair in (0, pair) for pair in together)
+        for team in teams
+    ]
+
+
+def balance_teams(players, mmr_exponent=3, limit=None):
     """
     Takes a list of 10 players and produces
     a list of suitable teams pairs.
@@ -31,6 +188,7 @@ def balance_teams(players, mmr_exponent=3):
                     ('Mikel',      2400),
                 ]
 
+    :param limit: return only this many best answers
     :return: a list of team pairs with some meta data
     """
 
@@ -80,12 +238,24 @@ def balance_teams(players, mmr_exponent=3):
     ]
 
     # sort answers by mmr difference
-    answers.sort(key=lambda x: x['mmr_diff_exp'])
+    answers = rank_answers(answers, key=lambda x: x['mmr_diff_exp'], limit=limit)
 
     return answers
 
 
-def role_balance_teams(players: List[Player], mmr_exponent=3):
+def role_balance_teams(players: List[Player], mmr_exponent=3, limit=None, apart=(), together=(),
+                       team_roles=None, policy=LadderSettings.LADDER_POLICY):
+    """
+    Takes a list of 10 players and produces a list of suitable team pairs
+    with best roles for each player.
+
+    :param apart: pairs of player ids that can't play in one team (blacklist)
+    :param together: pairs of player ids that must play in one team (premades)
+           If no answer satisfies these constraints, they are ignored.
+    :param team_roles: cache of best roles by team_key(); teams that are
+           already there (e.g. after a player substitution) are not scored again
+    :param policy: how answers are picked, see select_answers()
+    """
     def intersection(team, players):
         return len(set(team['players']).intersection(players))
 
@@ -94,23 +264,17 @@ def role_balance_teams(players: List[Player], mmr_exponent=3):
                intersection(answer[1], players) >= amount
 
     def assign_best_roles(team):
-        top2_mmr = team['players'][1].ladder_mmr
-
-        role_score_max = 0
-        best_roles = None
-        for roles in role_permutations:
-            role_score = 0
-            important_roles_mmr = []
-            for i, player in enumerate(team['players']):
-                role_score += getattr(player.roles, roles[i])
-                # remember mmrs of carry nad mid players to later check if they are okay
-                if roles[i] in ['carry', 'mid']:
-                    important_roles_mmr.append(player.ladder_mmr)
-
-            team_ok = all(top2_mmr - x < 1500 for x in important_roles_mmr)
-            if role_score > role_score_max and team_ok:
-                role_score_max = role_score
-                best_roles = roles
+        key = cached = None
+        if team_roles is not None:
+            key = team_key(team['players'])
+            cached = team_roles.get(key)
+
+        if cached:
+            best_roles, role_score_max = cached
+        else:
+            best_roles, role_score_max = find_best_roles(team)
+            if key:
+                team_roles.put(key, (best_roles, role_score_max))
 
         # sort players according to their roles
         sorted_players = []
@@ -129,17 +293,26 @@ def role_balance_teams(players: List[Player], mmr_exponent=3):
             'role_score_sum': role_score_max,
         })
 
-    def discard_unbalanced_answers(answers, diff_attempts):
-        if not diff_attempts:
-            return answers
+    def find_best_roles(team):
+        top2_mmr = team['players'][1].ladder_mmr
 
-        diff = diff_attempts[0]
-        new = [x for x in answers if x['mmr_diff'] <= diff]
+        role_score_max = 0
+        best_roles = None
+        for roles in role_permutations:
+            role_score = 0
+            important_roles_mmr = []
+            for i, player in enumerate(team['players']):
+                role_score += getattr(player.roles, roles[i])
+                # remember mmrs of carry nad mid players to later check if they are okay
+                if roles[i] in ['carry', 'mid']:
+                    important_roles_mmr.append(player.ladder_mmr)
 
-        if not new:
-            new = discard_unbalanced_answers(answers, diff_attempts[1:])
+            team_ok = all(top2_mmr - x < 1500 for x in important_roles_mmr)
+            if role_score > role_score_max and team_ok:
+                role_score_max = role_score
+                best_roles = roles
 
-        return new
+        return best_roles, role_score_max
 
     team_players = 5
 
@@ -163,12 +336,17 @@ def role_balance_teams(players: List[Player], mmr_exponent=3):
         for team in teams
     ]
 
-    for team in teams:
-        assign_best_roles(team)
+    # skip teams that break blacklist or premade constraints
+    feasible = feasible_teams(players, apart, together)
+
+    for team, ok in zip(teams, feasible):
+        if ok:
+            assign_best_roles(team)
 
     # combine teams into pairs against each other
     half = len(teams) // 2
     answers = zip(teams[:half], list(reversed(teams[half:])))
+    answers = [x for x, ok in zip(answers, feasible) if ok]
 
     # discard answers that place top 2 or lowest 2 players on same team
     top_players = players[:2]
@@ -179,6 +357,10 @@ def role_balance_teams(players: List[Player], mmr_exponent=3):
                both_teams_have(x, low_players, 1)
     ]
 
+    if not answers and (apart or together):
+        # constraints can't be satisfied, balance without them
+        return role_balance_teams(players, mmr_exponent, limit, team_roles=team_roles, policy=policy)
+
     # calc mmr differences for each pair of teams
     answers = [
         {
@@ -190,13 +372,7 @@ def role_balance_teams(players: List[Player], mmr_exponent=3):
         for answer in answers
     ]
 
-
-
-    # discard answers that have too unbalanced teams
-    answers = discard_unbalanced_answers(answers, diff_attempts=[200, 300, 400])
-
-    # sort answers by mmr difference
-    answers.sort(key=lambda x: (-x['role_score_sum'], x['mmr_diff_exp']))
+    answers = select_answers(answers, policy, limit)
 
     for answer in answers:
         for team in answer['teams']:
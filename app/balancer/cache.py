@@ -0,0 +1,95 @@
+import hashlib
+from collections import OrderedDict
+
+from app.balancer.balancer import role_names
+
+
+def players_fingerprint(players, mmr_exponent, role_balancing=True, apart=(), together=(), policy=None):
+    """
+    Canonical fingerprint of a balancer input.
+    Same players with same mmr, role prefs, team constraints and policy produce
+    the same fingerprint regardless of the order they joined the queue.
+    """
+    players = sorted(
+        (p.id, p.name, p.ladder_mmr) +
+        (tuple(getattr(p.roles, r) for r in role_names) if role_balancing else ())
+        for p in players
+    )
+    apart = sorted(tuple(sorted(pair)) for pair in apart)
+    together = sorted(tuple(sorted(pair)) for pair in together)
+    content = repr((players, mmr_exponent, role_balancing, apart, together, policy))
+
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+class BalanceCache:
+    """
+    In-process LRU of fingerprint -> BalanceResult id.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, is_valid=None):
+        """
+        :param is_valid: optional check for a cached id;
+                         entries that fail it are dropped and count as a miss
+        """
+        result_id = self.results.get(key)
+        if result_id is not None and is_valid and not is_valid(result_id):
+            self.discard(key)
+            result_id = None
+
+        if result_id is None:
+            self.misses += 1
+            return None
+
+        self.results.move_to_end(key)
+        self.hits += 1
+        return result_id
+
+    def put(self, key, result_id):
+        self.results[key] = result_id
+        self.results.move_to_end(key)
+
+        while len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+
+    def subset(self, is_wanted):
+        """
+        :return: new cache with entries whose keys pass is_wanted(key)
+        """
+        cache = BalanceCache(self.maxsize)
+        for key, value in self.results.items():
+            if is_wanted(key):
+                cache.results[key] = value
+        return cache
+
+    def update(self, other):
+        for key, value in other.results.items():
+            self.put(key, value)
+
+    def discard(self, key):
+        self.results.pop(key, None)
+
+    def clear(self):
+        self.results.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.results),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': float(self.hits) / total if total else 0,
+        }
+
+
+balance_cache = BalanceCache()
+
+# best roles for teams seen recently, see balancer.team_key();
+# after a player substitution only teams with the new player are scored
+team_roles_cache = BalanceCache(maxsize=4096)
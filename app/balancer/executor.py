@@ -0,0 +1,78 @@
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from app.balancer.cache import team_roles_cache
+from app.balancer.managers import BalanceResultManager
+
+
+def run_balancer(snapshot, limit, team_roles):
+    # runs in a worker process; balancer itself doesn't touch the database.
+    # Team roles cache lives in the parent process, worker gets roles
+    # of known teams of this lobby and gives back the ones it scored.
+    answers = BalanceResultManager.run_balancer(snapshot, limit, team_roles)
+    return answers, team_roles
+
+
+class BalanceExecutor:
+    """
+    Balances queues in a pool of worker processes, so event loop
+    is not blocked when several queues fill up at once.
+    Balances of the same queue are done in the order they were requested.
+
+    Last result of each queue is kept, so when a player of a full queue
+    is replaced (leave, votekick), only teams with the new player are scored.
+    """
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.pool = None  # started on first use
+        self.queue_locks = defaultdict(asyncio.Lock)
+        self.queue_results = {}  # queue id -> last BalanceResult
+
+    async def balance(self, queue_id, players):
+        """
+        :return: saved BalanceResult for the players
+        """
+        async with self.queue_locks[queue_id]:
+            previous = self.queue_results.get(queue_id)
+            substitution = previous and BalanceResultManager.substitution(previous, players)
+            if substitution:
+                result, snapshot, fingerprint = BalanceResultManager.prepare_rebalance(previous, *substitution)
+            else:
+                result, snapshot, fingerprint = BalanceResultManager.prepare_balance(players)
+
+            if not result:
+                result = await self.run(snapshot, fingerprint)
+
+            self.queue_results[queue_id] = result
+            return result
+
+    async def run(self, snapshot, fingerprint):
+        if not self.pool:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        player_ids = set(p[0] for p in snapshot['players'])
+        team_roles = team_roles_cache.subset(lambda key: all(p[0] in player_ids for p in key))
+
+        limit = BalanceResultManager.answers_limit
+        loop = asyncio.get_event_loop()
+        answers, team_roles = await loop.run_in_executor(self.pool, run_balancer, snapshot, limit, team_roles)
+        team_roles_cache.update(team_roles)
+
+        return BalanceResultManager.save_result(snapshot, answers, fingerprint)
+
+    def prune(self, active_queue_ids):
+        """
+        Forgets queues that are not active anymore.
+        """
+        active_queue_ids = set(active_queue_ids)
+        for queue_id in list(self.queue_locks):
+            if queue_id not in active_queue_ids and not self.queue_locks[queue_id].locked():
+                del self.queue_locks[queue_id]
+        for queue_id in list(self.queue_results):
+            if queue_id not in active_queue_ids:
+                del self.queue_results[queue_id]
+
+    def shutdown(self):
+        if self.pool:
+            self.pool.shutdown()
@@ -0,0 +1,87 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.balancer import balancer, vectorized
+from app.balancer.synthetic import synthetic_players, synthetic_teams
+
+
+class Command(BaseCommand):
+    # times balancer functions on seeded synthetic players
+    # and checks that faster engines give the same answers as balancer.py;
+    # doesn't need the database or discord
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--inputs',
+                            nargs='?', type=int, default=200, const=200)
+        parser.add_argument('-e', '--exponent',
+                            nargs='?', type=int, default=3, const=3)
+        parser.add_argument('--seed',
+                            nargs='?', type=int, default=0, const=0)
+
+    def handle(self, *args, **options):
+        seeds = range(options['seed'], options['seed'] + options['inputs'])
+        exponent = options['exponent']
+
+        self.check_engines(seeds, exponent)
+
+        benchmarks = [
+            ('balance_teams',
+             lambda players: balancer.balance_teams(players, exponent),
+             lambda seed: [(p.name, p.ladder_mmr) for p in synthetic_players(seed)]),
+            ('role_balance_teams',
+             lambda players: balancer.role_balance_teams(players, exponent),
+             synthetic_players),
+            ('role_balance_teams (numpy)',
+             lambda players: vectorized.role_balance_teams(players, exponent),
+             synthetic_players),
+            ('balance_from_teams',
+             lambda teams: balancer.balance_from_teams(teams, exponent),
+             synthetic_teams),
+        ]
+
+        print(f'{"function":30} {"ops/sec":>10} {"p50 ms":>9} {"p99 ms":>9} {"peak KiB":>9}')
+        for name, func, make_input in benchmarks:
+            inputs = [make_input(seed) for seed in seeds]
+            stats = self.run_benchmark(func, inputs)
+            print(f'{name:30} {stats["ops"]:10.1f} {stats["p50"]:9.3f} {stats["p99"]:9.3f} {stats["peak"]:9.1f}')
+
+    @staticmethod
+    def run_benchmark(func, inputs):
+        times = []
+        for data in inputs:
+            start = time.perf_counter()
+            func(data)
+            times.append(time.perf_counter() - start)
+
+        # separate run for memory, tracemalloc slows everything down
+        tracemalloc.start()
+        for data in inputs:
+            func(data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        times.sort()
+        return {
+            'ops': len(times) / sum(times),
+            'p50': times[len(times) // 2] * 1000,
+            'p99': times[min(len(times) - 1, len(times) * 99 // 100)] * 1000,
+            'peak': peak / 1024,
+        }
+
+    @staticmethod
+    def check_engines(seeds, exponent):
+        for seed in seeds:
+            # same seed for side assignment, so answers must be equal as is
+            random.seed(seed)
+            expected = balancer.role_balance_teams(synthetic_players(seed), exponent)
+            random.seed(seed)
+            answers = vectorized.role_balance_teams(synthetic_players(seed), exponent)
+
+            if answers != expected:
+                raise CommandError(f'NumPy engine answers differ from balancer.py for seed {seed}')
+
+        print(f'Engines give identical answers for {len(seeds)} inputs.')
@@ -0,0 +1,40 @@
+import random
+import time
+from statistics import mean
+
+from django.core.management.base import BaseCommand
+
+from app.balancer.matchmaker import Candidate, select_players
+from app.balancer.synthetic import synthetic_player
+
+
+class Command(BaseCommand):
+    # measures matchmaker latency for different pool sizes on random pools;
+    # doesn't touch the database
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('-s', '--sizes',
+                            nargs='+', type=int, default=[10, 15, 20, 25, 30])
+        parser.add_argument('-r', '--runs',
+                            nargs='?', type=int, default=10, const=10)
+        parser.add_argument('--seed',
+                            nargs='?', type=int, default=0, const=0)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+
+        print('pool   avg ms   max ms')
+        for size in options['sizes']:
+            times = []
+            for _ in range(options['runs']):
+                pool = [
+                    Candidate(synthetic_player(rnd, i), rnd.uniform(0, 30))  # wait time in minutes
+                    for i in range(size)
+                ]
+
+                start = time.perf_counter()
+                select_players(pool)
+                times.append((time.perf_counter() - start) * 1000)
+
+            print(f'{size:4}  {mean(times):7.1f}  {max(times):7.1f}')
@@ -4,6 +4,7 @@ import asyncio
 import datetime
 import itertools
 import re
+import traceback
 from collections import defaultdict, deque
 from datetime import timedelta
 from datetime import datetime
@@ -19,14 +20,16 @@ from django.core.management.base import BaseCommand
 import os
 
 from django.core.urlresolvers import reverse
-from django.db.models import Q, Count, Case, When, F
+from django.db.models import Q, Count, F
 from django.utils import timezone
 
+from app.balancer.executor import BalanceExecutor
 from app.balancer.managers import BalanceResultManager, BalanceAnswerManager
 from app.balancer.models import BalanceAnswer
 from app.ladder.managers import MatchManager, QueueChannelManager
 from app.ladder.models import Player, LadderSettings, LadderQueue, QueuePlayer, QueueChannel, MatchPlayer, \
-    RolesPreference, DiscordChannels, DiscordPoll, ScoreChange, PlayerReport
+    RolesPreference, DiscordChannels, DiscordPoll, ScoreChange, PlayerReport, \
+    PlayerSeasonStats
 
 from app.balancer.management.commands.discord.report_tip_commands import ReportTipCommands
 
@@ -59,6 +62,7 @@ class Command(BaseCommand):
         self.queued_players = set()
         self.last_queues_update = timezone.now()
         self.report_tip_commands = ReportTipCommands()
+        self.balance_executor = BalanceExecutor(int(os.environ.get('BALANCE_WORKERS', 2)))
 
         # cached discord models
         self.queue_messages = {}
@@ -255,6 +259,9 @@ class Command(BaseCommand):
             if queued_players != self.queued_players or outdated:
                 await self.queues_show()
 
+            active_queues = LadderQueue.objects.filter(active=True).values_list('id', flat=True)
+            self.balance_executor.prune(active_queues)
+
 
         @tasks.loop(minutes=1)
         async def activate_queue_channels():
@@ -447,43 +454,24 @@ class Command(BaseCommand):
         player_url = f'{host}{url}'
 
         season = LadderSettings.get_solo().current_season
-        player.matches = player.matchplayer_set \
-            .filter(match__season=season) \
-            .select_related('match')
-        wins = sum(1 if m.match.winner == m.team else 0 for m in player.matches)
-        losses = len(player.matches) - wins
+        stats = PlayerSeasonStats.objects.filter(player=player, season=season).first() or \
+            PlayerSeasonStats(player=player, season=season)
         # Query for reports and tips count
         reports_count = PlayerReport.objects.filter(to_player=player, value__lt=0).count()
         tips_count = PlayerReport.objects.filter(to_player=player, value__gt=0).count()
 
-        mps = player.matchplayer_set.filter(match__season=LadderSettings.get_solo().current_season)
-        results = ['win' if x.team == x.match.winner else 'loss' for x in mps]
-        streaks = [list(g) for k, g in itertools.groupby(results)]
-        streak = {}
-        max_streak = {}
-        losing_streak = 0
-        winning_streak = 0
         escaped_name = player.name.replace('_', '-')
 
-        if len(streaks):
-            streak = streaks[0]
-            max_streak = max(streaks, key=len)
-            for s in streaks:
-                if len(s) > winning_streak and s[0] == "win":
-                    winning_streak = len(s)
-                if len(s) > losing_streak and s[0] == "loss":
-                    losing_streak = len(s)
-
         await msg.channel.send(t("whois_stats").format(
             escaped_name,
             player.rank_score,
             player.ladder_mmr,
             player.dota_mmr,
-            len(player.matches),
-            round(wins/(wins+losses)*100) if wins+losses != 0  else 0,
-            f'{"+" if streak and streak[0] == "win" else "-"}{len(streak)}',
-            winning_streak,
-            losing_streak,
+            stats.matches,
+            round(stats.wins/stats.matches*100) if stats.matches != 0 else 0,
+            f'{"+" if stats.streak > 0 else "-"}{abs(stats.streak)}',
+            stats.best_streak,
+            stats.worst_streak,
             tips_count,
             reports_count,
             player.roles.carry,
@@ -665,9 +653,7 @@ class Command(BaseCommand):
         await msg.channel.send(t("forced_queue").format(msg.author, self.player_mention(player)))
 
         # TODO: this is a separate function
-        if queue.players.count() == 10:
-            Command.balance_queue(queue)
-
+        if queue.players.count() == 10 and await self.balance_queue_async(queue):
             balance_str = ''
             if LadderSettings.get_solo().draft_mode == LadderSettings.AUTO_BALANCE:
                 balance_str = f'Proposed balance: \n' + \
@@ -776,15 +762,10 @@ class Command(BaseCommand):
             season = LadderSettings.get_solo().current_season
             qs = Player.objects \
                 .order_by('-score', '-ladder_mmr') \
-                .filter(matchplayer__match__season=season).distinct()\
+                .filter(playerseasonstats__season=season)\
                 .annotate(
-                    match_count=Count('matchplayer'),
-                    wins=Count(Case(
-                        When(
-                            matchplayer__team=F('matchplayer__match__winner'), then=1)
-                    )
-                    ),
-                    losses=F('match_count') - F('wins'),
+                    wins=F('playerseasonstats__wins'),
+                    losses=F('playerseasonstats__losses'),
                 )
             players = qs[:limit]
             if bottom:
@@ -1165,6 +1146,10 @@ class Command(BaseCommand):
             # Fetch the LadderQueue instance
             queue = LadderQueue.objects.get(id=queue_id)
             # Extract the BalanceAnswer from the queue instance
+            if queue.balance is None:
+                # full queue is balanced in background
+                await msg.channel.send(t("queue_no_balance").format(queue.id))
+                return
 
             radiant, dire, radiant_mmr, dire_mmr = Command.get_teams_from_queue(queue)
 
@@ -1263,27 +1248,44 @@ class Command(BaseCommand):
 
         response = t("joined_inhouse").format(player, queue.id)
 
-        is_queue_full = False
         # TODO: this is a separate function
         if queue.players.count() == 10:
-            is_queue_full = True
-            Command.balance_queue(queue)  # todo move this to QueuePlayer signal
+            # balance in background, message is posted when it's done
+            future = asyncio.ensure_future(self.full_queue_balance(queue))  # todo move this to QueuePlayer signal
+            future.add_done_callback(lambda f: self.full_queue_balance_done(f, queue))
             # response = TRANSLATIONS[LANG]["balance_str"].format(Command.balance_str(queue.balance))
 
-            mention_str = f' '.join(self.player_mention(p) for p in queue.players.all())
-            # "proposed_balance": "Kolejka jest pełna\n{}\n{}\nMasz {} min aby dołączyć do poczekalni",
-            #   "balance_str": "Proponowany balans:\n{}",
-            emoji = discord.utils.get(self.bot.emojis, id=968636489271476224) # Akek
-            if not emoji:
-                emoji = discord.utils.get(self.bot.emojis, id=1224958910599925785)  # dotaCraft hole fallback
+        return queue, True, response
 
-            finalize = t("proposed_balance").format(queue.id, emoji, mention_str, WAITING_TIME_MINS)
-            response = t("joined_inhouse").format(player, queue.id)
+    async def full_queue_balance(self, queue, in_process=False):
+        if not await self.balance_queue_async(queue, in_process):
+            return  # queue changed while balancing
 
-            # await self.queues_channel.send(finalize)
-            await self.chat_channel.send(finalize)
+        mention_str = f' '.join(self.player_mention(p) for p in queue.players.all())
+        # "proposed_balance": "Kolejka jest pełna\n{}\n{}\nMasz {} min aby dołączyć do poczekalni",
+        #   "balance_str": "Proponowany balans:\n{}",
+        emoji = discord.utils.get(self.bot.emojis, id=968636489271476224) # Akek
+        if not emoji:
+            emoji = discord.utils.get(self.bot.emojis, id=1224958910599925785)  # dotaCraft hole fallback
 
-        return queue, True, response
+        finalize = t("proposed_balance").format(queue.id, emoji, mention_str, WAITING_TIME_MINS)
+
+        # await self.queues_channel.send(finalize)
+        await self.chat_channel.send(finalize)
+
+    def full_queue_balance_done(self, future, queue, retry=True):
+        if future.cancelled() or not future.exception():
+            return
+
+        error = future.exception()
+        print(f'Balance of queue {queue.id} failed: {error!r}')
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+        if retry:
+            # worker pool can break (worker killed), balance here instead
+            print(f'Balancing queue {queue.id} in process.')
+            future = asyncio.ensure_future(self.full_queue_balance(queue, in_process=True))
+            future.add_done_callback(lambda f: self.full_queue_balance_done(f, queue, retry=False))
 
     @staticmethod
     def add_player_to_queue(player, channel):
@@ -1311,13 +1313,25 @@ class Command(BaseCommand):
 
         return queue
 
-    @staticmethod
-    def balance_queue(queue):
+    async def balance_queue_async(self, queue, in_process=False):
+        """
+        Balances queue players in a worker process.
+        :param in_process: balance in this process, blocks the event loop
+        :return: False if queue players changed while balancing
+        """
         players = list(queue.players.all())
-        result = BalanceResultManager.balance_teams(players)
+        if in_process:
+            result = BalanceResultManager.balance_teams(players)
+        else:
+            result = await self.balance_executor.balance(queue.id, players)
+
+        players_now = set(queue.players.values_list('id', flat=True))
+        if players_now != set(p.id for p in players):
+            return False
 
         queue.balance = result.answers.first()
-        queue.save()
+        LadderQueue.objects.filter(id=queue.id).update(balance=queue.balance)
+        return True
 
     @staticmethod
     def balance_str(balance: BalanceAnswer, verbose=True):
@@ -1364,6 +1378,9 @@ class Command(BaseCommand):
 
     @staticmethod
     def get_teams_from_queue(q):
+        """
+        Queue must have a balance, full queues get it in background.
+        """
         answer = q.balance
 
         radiant_team = answer.teams[0]
@@ -1387,6 +1404,15 @@ class Command(BaseCommand):
 
         game_str = ''
 
+        if players.count() == 10 and q.balance is None:
+            # queue is being balanced in background
+            return t("queue_balancing").format(
+                q.id,
+                avg_mmr,
+                "\n".join([f'{i + 1}. ' + "{:<15}".format(f'[#{p.rank_score}][{p.ladder_mmr}]') + f'<{p.name}>' for i, p in
+                           enumerate(players)])
+            )
+
         if players.count() == 10:
             radiant, dire, radiant_mmr, dire_mmr = Command.get_teams_from_queue(q)
             _radiant = [(p.name, p.ladder_mmr) for p in radiant]
@@ -1434,7 +1460,7 @@ class Command(BaseCommand):
     def queue_full_msg(self, queue, show_balance=True):
         balance_str = ''
         auto_balance = LadderSettings.get_solo().draft_mode == LadderSettings.AUTO_BALANCE
-        if auto_balance and show_balance:
+        if auto_balance and show_balance and queue.balance is not None:
             balance_str = t("balance_str").format(Command.balance_str(queue.balance))
 
         return t("proposed_balance").format(balance_str, f' '.join(self.player_mention(p) for p in queue.players.all()), WAITING_TIME_MINS)
@@ -9,12 +9,12 @@ from django.core.management.base import BaseCommand
 from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from app.balancer.managers import BalanceResultManager, BalanceAnswerManager
-from app.ladder.managers import MatchManager, PlayerManager
+from app.ladder.managers import PlayerManager
 from django.utils.datetime_safe import datetime
 from enum import IntEnum
 from collections import defaultdict
 import gevent
-from app.ladder.models import Player, LadderSettings, LadderQueue
+from app.ladder.models import Player, LadderSettings, LadderQueue, Job
 import dota2
 import os
 
@@ -421,12 +421,16 @@ class Command(BaseCommand):
         except (IndexError, ValueError):
             answer_num = 1
 
+        # only best answers are saved when balancing, the rest are made on demand
+        BalanceResultManager.load_answers(result, answer_num)
+        answer_num = min(answer_num, result.answers.count())
+
         url = reverse('balancer:balancer-result', args=(result.id,))
         host = os.environ.get('BASE_URL', 'localhost:8000')
 
         url = '%s%s?page=%s' % (host, url, answer_num)
 
-        bot.balance_answer = answer = result.answers.all()[answer_num - 1]
+        bot.balance_answer = answer = result.answers.order_by('id')[answer_num - 1]
         for i, team in enumerate(answer.teams):
             player_names = [p[0] for p in team['players']]
             bot.channels.lobby.send('Team %d (avg. %d): %s' %
@@ -970,6 +974,11 @@ class Command(BaseCommand):
             bot.channels.lobby.send('Queue is not full.')
             return
 
+        if bot.queue.balance is None:
+            # full queue is balanced in background by discord bot
+            bot.channels.lobby.send('Queue is being balanced, try again in a moment.')
+            return
+
         captain_names = [team['players'][0][0] for team in bot.queue.balance.teams]
         captains = [Player.objects.get(name=name) for name in captain_names]
         random.shuffle(captains)
@@ -1149,13 +1158,14 @@ class Command(BaseCommand):
             print('No need to record match result for this queue')
             return
 
-        # TODO: write smth like "record_balance(answer, 0 if RadVictory else 1, match_id)"
+        # match is recorded by run_jobs command in its own process,
+        # database calls here would block all lobby bots
         if lobby.match_outcome == EMatchOutcome.RadVictory:
             print('Radiant won!')
-            MatchManager.record_balance(queue.balance, 0, lobby.match_id)
+            Job.objects.record_match(queue.balance, 0, lobby.match_id)
         elif lobby.match_outcome == EMatchOutcome.DireVictory:
             print('Dire won!')
-            MatchManager.record_balance(queue.balance, 1, lobby.match_id)
+            Job.objects.record_match(queue.balance, 1, lobby.match_id)
 
     # checks if teams are setup according to balance
     @staticmethod
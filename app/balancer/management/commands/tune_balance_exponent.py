@@ -0,0 +1,63 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.balancer.models import ExponentReport
+from app.balancer.tuning import default_exponents, load_lobbies, tune_exponent, changed_teams_warning
+from app.ladder.models import LadderSettings
+
+
+class Command(BaseCommand):
+    # evaluates balance exponents on recorded matches and saves the report;
+    # with --apply recommended exponent is set in LadderSettings
+    help = 'Scores balance exponents by how well they predict winners of played teams ' \
+           '(predictive fit, not quality of teams the balancer would make) ' \
+           'and by how many lobbies the balancer would split differently.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-s', '--seasons', nargs='+', type=int, default=None)
+        parser.add_argument('-e', '--exponents', nargs='+', type=float, default=default_exponents)
+        parser.add_argument('-w', '--workers',
+                            nargs='?', type=int, default=os.cpu_count(), const=os.cpu_count())
+        parser.add_argument('--apply', action='store_true', default=False)
+
+    def handle(self, *args, **options):
+        ladder = LadderSettings.get_solo()
+        seasons = options['seasons'] or [ladder.current_season]
+
+        lobbies = load_lobbies(seasons)
+        print(f'Seasons {seasons}: {len(lobbies)} matches.')
+        if not lobbies:
+            return
+
+        start = time.perf_counter()
+        recommended, report = tune_exponent(lobbies, options['exponents'], options['workers'])
+        print(f'Evaluated {len(report)} exponents in {time.perf_counter() - start:.1f} s.')
+        print()
+
+        print(f'{"exponent":>8} {"accuracy":>8} {"log loss":>8} {"changed teams":>13}')
+        for r in report:
+            print(f'{r["exponent"]:8g} {r["accuracy"]:8.1%} {r["log_loss"]:8.4f} {r["changed_teams"]:13.1%}')
+        print()
+        print('Accuracy and log loss show how well exponent mmr diff of played teams predicts winners, '
+              'not how good teams balanced with this exponent would be.')
+        print()
+
+        ExponentReport.objects.create(
+            seasons=seasons,
+            matches=len(lobbies),
+            recommended=recommended,
+            report=report,
+        )
+        print(f'Recommended exponent: {recommended:g} (current: {ladder.balance_exponent:g})')
+
+        changed = next(r['changed_teams'] for r in report if r['exponent'] == recommended)
+        if changed > changed_teams_warning:
+            print(f'Warning: with this exponent balancer would split {changed:.0%} of lobbies differently, '
+                  f'its fit on played teams says little about those teams.')
+
+        if options['apply']:
+            ladder.balance_exponent = recommended
+            ladder.save()
+            print('Balance exponent updated.')
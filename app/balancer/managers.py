@@ -1,41 +1,279 @@
 from django.db import models, transaction
-from app.balancer.balancer import balance_teams, balance_from_teams, role_balance_teams
-from app.ladder.models import LadderSettings
+from django.db.models import Q
+from app.balancer import vectorized
+from app.balancer.cache import balance_cache, team_roles_cache, players_fingerprint
+from app.balancer.balancer import balance_teams, balance_from_teams, role_balance_teams, role_names, \
+    BalancerPlayer
+from app.ladder.models import LadderSettings, Player
+
+
+def balance_exponent(ladder):
+    # whole exponents are kept int, so balancer can use integer math
+    exponent = ladder.balance_exponent
+    return int(exponent) if float(exponent).is_integer() else exponent
 
 
 class BalanceResultManager(models.Manager):
+    # only this many best answers are saved when balancing,
+    # the rest are generated on demand by load_answers()
+    answers_limit = 10
+
+    @staticmethod
+    def balance_teams(players, role_balancing=True, engine=None, together=()):
+        """
+        Balances players and saves the result.
+        With role balancing blacklisted players never get into one team
+        and `together` pairs of player ids (premades) always do,
+        unless there is no way to satisfy this.
+        """
+        result, snapshot, fingerprint = BalanceResultManager.prepare_balance(
+            players, role_balancing, engine, together)
+        if result:
+            return result
+
+        answers = BalanceResultManager.run_balancer(snapshot, BalanceResultManager.answers_limit)
+
+        return BalanceResultManager.save_result(snapshot, answers, fingerprint)
+
     @staticmethod
-    def balance_teams(players, role_balancing=True):
+    def prepare_balance(players, role_balancing=True, engine=None, together=()):
+        """
+        Gathers everything balancer needs from the database.
+
+        :return: (cached BalanceResult or None, balancer input snapshot, fingerprint)
+        """
         from app.balancer.models import BalanceResult, BalanceAnswer
 
-        # balance teams and save result
-        # TODO: make mmr_exponent changable from admin panel
-        mmr_exponent = LadderSettings.get_solo().balance_exponent
+        ladder = LadderSettings.get_solo()
+        if engine is None:
+            engine = ladder.balance_engine
+
+        mmr_exponent = balance_exponent(ladder)
+
+        # same players with same mmr and roles give the same balance,
+        # reuse it if nobody took its answers yet
+        def is_free(result_id):
+            return BalanceResult.objects.filter(id=result_id).exists() and \
+                not BalanceAnswer.objects.filter(result_id=result_id).filter(
+                    Q(match__isnull=False) | Q(ladderqueue__isnull=False)
+                ).exists()
+
+        players = list(players)
+
+        apart = []
         if role_balancing:
-            answers = role_balance_teams(players, mmr_exponent)
+            apart = BalanceResultManager.blacklist_pairs(players)
         else:
-            players = [(p.name, p.ladder_mmr) for p in players]
-            answers = balance_teams(players, mmr_exponent)
+            together = []  # constraints work only with role balancing
+
+        policy = ladder.balance_policy
+        fingerprint = players_fingerprint(players, mmr_exponent, role_balancing, apart, together, policy)
+        snapshot = BalanceResultManager.players_snapshot(
+            players, mmr_exponent, role_balancing, engine, apart, together, policy)
+
+        result_id = balance_cache.get(fingerprint, is_valid=is_free)
+        if result_id:
+            return BalanceResult.objects.get(id=result_id), snapshot, fingerprint
+
+        return None, snapshot, fingerprint
+
+    @staticmethod
+    def save_result(snapshot, answers, fingerprint=None):
+        from app.balancer.models import BalanceResult
+
+        limit = BalanceResultManager.answers_limit
 
         with transaction.atomic():
-            result = BalanceResult.objects.create(mmr_exponent=mmr_exponent)
-            for answer in answers:
-                BalanceAnswer.objects.create(
-                    teams=answer['teams'],
-                    mmr_diff=answer['mmr_diff'],
-                    mmr_diff_exp=answer['mmr_diff_exp'],
-                    result=result
-                )
+            result = BalanceResult.objects.create(
+                mmr_exponent=snapshot['mmr_exponent'],
+                players=snapshot,
+                # if we got less answers than asked, these are all of them
+                answers_total=len(answers) if len(answers) < limit else None,
+            )
+            BalanceResultManager.save_answers(result, answers)
+
+        if fingerprint:
+            balance_cache.put(fingerprint, result.id)
 
         return result
 
+    @staticmethod
+    def rebalance(result, out_player_id, in_player):
+        """
+        Balances players of a previous result with one player substituted.
+        Roles of teams without the new player are taken from team roles cache,
+        so only teams with the new player are scored again.
+        """
+        cached, snapshot, fingerprint = BalanceResultManager.prepare_rebalance(result, out_player_id, in_player)
+        if cached:
+            return cached
+
+        answers = BalanceResultManager.run_balancer(snapshot, BalanceResultManager.answers_limit)
+
+        return BalanceResultManager.save_result(snapshot, answers, fingerprint)
+
+    @staticmethod
+    def prepare_rebalance(result, out_player_id, in_player):
+        """
+        Same as prepare_balance() for the players of a previous result
+        with one player substituted.
+        """
+        if not result.players or not result.players['role_balancing']:
+            raise ValueError('Result has no players snapshot to rebalance')
+
+        players = [
+            BalancerPlayer(*p) for p in result.players['players']
+            if p[0] != out_player_id
+        ]
+        players.append(in_player)
+
+        return BalanceResultManager.prepare_balance(
+            players,
+            engine=result.players['engine'],
+            together=result.players.get('together', []),
+        )
+
+    @staticmethod
+    def substitution(result, players):
+        """
+        Checks if players are the players of a previous result with one of them
+        substituted, and the rest still have the same mmr and roles.
+
+        :return: (out player id, in player) or None
+        """
+        if not result.players or not result.players['role_balancing']:
+            return None
+
+        old = {p[0]: p for p in result.players['players']}
+        new = {p[0]: p for p in BalanceResultManager.players_snapshot(players, None)['players']}
+
+        out_ids = old.keys() - new.keys()
+        in_ids = new.keys() - old.keys()
+        if len(out_ids) != 1 or len(in_ids) != 1:
+            return None
+
+        if any(old[player_id] != new[player_id] for player_id in old.keys() & new.keys()):
+            return None
+
+        in_id = in_ids.pop()
+        return out_ids.pop(), next(p for p in players if p.id == in_id)
+
+    @staticmethod
+    def blacklist_pairs(players):
+        ids = [p.id for p in players]
+
+        return [
+            list(pair) for pair in Player.blacklist.through.objects
+            .filter(from_player__in=ids, to_player__in=ids)
+            .values_list('from_player_id', 'to_player_id')
+        ]
+
+    @staticmethod
+    def players_snapshot(players, mmr_exponent, role_balancing=True, engine=None, apart=(), together=(),
+                         policy=LadderSettings.LADDER_POLICY):
+        if role_balancing:
+            players = [
+                [p.id, p.name, p.ladder_mmr, [getattr(p.roles, r) for r in role_names]]
+                for p in players
+            ]
+        else:
+            players = [[p.name, p.ladder_mmr] for p in players]
+
+        return {
+            'players': players,
+            'mmr_exponent': mmr_exponent,
+            'role_balancing': role_balancing,
+            'engine': engine,
+            'apart': [list(pair) for pair in apart],
+            'together': [list(pair) for pair in together],
+            'policy': policy,
+        }
+
+    @staticmethod
+    def run_balancer(snapshot, limit=None, team_roles=None):
+        """
+        :param team_roles: team roles cache to use instead of team_roles_cache
+                           (worker processes get one from the parent process)
+        """
+        mmr_exponent = snapshot['mmr_exponent']
+
+        if not snapshot['role_balancing']:
+            players = [tuple(p) for p in snapshot['players']]
+            return balance_teams(players, mmr_exponent, limit=limit)
+
+        players = [BalancerPlayer(*p) for p in snapshot['players']]
+        options = {
+            'apart': snapshot.get('apart', []),
+            'together': snapshot.get('together', []),
+            'team_roles': team_roles_cache if team_roles is None else team_roles,
+            'policy': snapshot.get('policy', LadderSettings.LADDER_POLICY),
+        }
+
+        if snapshot['engine'] == LadderSettings.NUMPY_ENGINE:
+            return vectorized.role_balance_teams(players, mmr_exponent, limit=limit, **options)
+        return role_balance_teams(players, mmr_exponent, limit=limit, **options)
+
+    @staticmethod
+    def save_answers(result, answers):
+        from app.balancer.models import BalanceAnswer
+
+        BalanceAnswer.objects.bulk_create([
+            BalanceAnswer(
+                teams=answer['teams'],
+                mmr_diff=answer['mmr_diff'],
+                mmr_diff_exp=answer['mmr_diff_exp'],
+                result=result
+            )
+            for answer in answers
+        ])
+
+    @staticmethod
+    def load_answers(result, count=None):
+        """
+        Makes sure that `count` best answers (all if None) of the result
+        are saved, generating missing ones from players snapshot.
+        Also finds out answers_total if it's not known yet.
+        """
+        from app.balancer.models import BalanceResult
+
+        def is_loaded(answers_total, saved):
+            if answers_total is None:
+                return False
+            return saved >= (answers_total if count is None else min(count, answers_total))
+
+        if not result.players:
+            return  # old result, all answers were saved
+
+        if is_loaded(result.answers_total, result.answers.count()):
+            return  # nothing to do
+
+        with transaction.atomic():
+            # another process can be loading answers of this result,
+            # it's done when the lock is released
+            locked = BalanceResult.objects.select_for_update().get(id=result.id)
+            saved = locked.answers.count()
+            if is_loaded(locked.answers_total, saved):
+                result.answers_total = locked.answers_total
+                return
+
+            # balancer is deterministic except for team sides,
+            # so answers come in the same order as the saved ones
+            answers = BalanceResultManager.run_balancer(result.players)
+
+            if locked.answers_total is None:
+                locked.answers_total = len(answers)
+                locked.save(update_fields=['answers_total'])
+            result.answers_total = locked.answers_total
+
+            BalanceResultManager.save_answers(result, answers[saved:count])
+
 
 class BalanceAnswerManager(models.Manager):
     @staticmethod
     def balance_custom(teams):
         from app.balancer.models import BalanceAnswer
 
-        mmr_exponent = LadderSettings.get_solo().balance_exponent
+        mmr_exponent = balance_exponent(LadderSettings.get_solo())
         answer = balance_from_teams(teams, mmr_exponent)
 
         answer = BalanceAnswer.objects.create(
@@ -44,4 +282,4 @@ class BalanceAnswerManager(models.Manager):
             mmr_diff_exp=answer['mmr_diff_exp'],
         )
 
-        return answer
\ No newline at end of file
+        return answer
@@ -0,0 +1,168 @@
+from collections import namedtuple
+
+from app.balancer.balancer import role_names
+
+
+lobby_size = 10
+
+# cost of a lobby is:
+#     spread_weight * (max mmr - min mmr)
+#   + roles_weight * (missing role preference points)
+#   - wait_weight * (total wait time in minutes)
+#
+# missing role preference points: for each role we want 2 players
+# (one per team) who prefer it the most, a perfect lobby has 2 fives for every role
+spread_weight = 1
+roles_weight = 50
+wait_weight = 10
+
+max_coverage = 5 * 2 * len(role_names)
+
+Candidate = namedtuple('Candidate', ['player', 'wait'])
+
+
+def role_coverage(top2):
+    return sum(sum(x) for x in top2)
+
+
+def merge_top2(a, b):
+    return [tuple(sorted(x + y, reverse=True)[:2]) for x, y in zip(a, b)]
+
+
+def select_players(candidates, keep_oldest=True, max_nodes=20000):
+    """
+    Picks the best lobby of 10 out of a pool of queued players.
+    Search is a branch and bound over players sorted by mmr:
+    role coverage is bounded by the part of the pool that is not decided yet,
+    spread and wait time are bounded together for every possible
+    highest mmr player of the lobby, so most branches are cut early.
+
+    :param candidates: list of Candidate(player, wait minutes)
+    :param keep_oldest: longest waiting player always gets the game
+    :param max_nodes: search stops after this many steps
+                      and returns the best lobby found so far
+    :return: (list of 10 candidates, lobby cost) or (None, None) if pool is too small
+    """
+    n = len(candidates)
+    if n < lobby_size:
+        return None, None
+
+    candidates = sorted(candidates, key=lambda c: c.player.ladder_mmr)
+    mmr = [c.player.ladder_mmr for c in candidates]
+    wait = [c.wait for c in candidates]
+    roles = [[(getattr(c.player.roles, r),) for r in role_names] for c in candidates]
+    oldest = max(range(n), key=lambda i: wait[i]) if keep_oldest else None
+
+    # bounds for not decided part of the pool:
+    #   range_waits[i][j][k] - sum of k longest waits of players i..j
+    #   suffix_top2[i] - 2 best preferences for each role of players i..n-1
+    #   window_bound[i] - lowest spread and wait cost of a lobby of players i..n-1
+    range_waits = [[None] * n for _ in range(n)]
+    for i in range(n):
+        waits = []
+        for j in range(i, n):
+            waits = sorted(waits + [wait[j]], reverse=True)[:lobby_size]
+            sums = [0]
+            for w in waits:
+                sums.append(sums[-1] + w)
+            range_waits[i][j] = sums + [float('inf')] * (lobby_size + 1 - len(sums))
+
+    suffix_top2 = [[()] * len(role_names)] * (n + 1)
+    for i in reversed(range(n)):
+        suffix_top2[i] = merge_top2(suffix_top2[i + 1], roles[i])
+
+    def cost(spread, top2, wait_sum):
+        return spread * spread_weight + \
+               (max_coverage - role_coverage(top2)) * roles_weight - \
+               wait_sum * wait_weight
+
+    def spread_wait_bound(i, left, lowest, wait_sum):
+        # lobby is completed with `left` players of i..j, player j has the highest mmr
+        first = i + left - 1
+        if oldest is not None and oldest >= i:
+            first = max(first, oldest)  # oldest player is not taken yet
+        return min(
+            [(mmr[j] - lowest) * spread_weight - (wait_sum + range_waits[i][j][left]) * wait_weight
+             for j in range(first, n)],
+            default=float('inf')
+        )
+
+    window_bound = [float('inf')] * (n + 1)
+    for i in reversed(range(n)):
+        window_bound[i] = window_bound[i + 1]
+        if oldest is None or i <= oldest:
+            window_bound[i] = min(window_bound[i], spread_wait_bound(i, lobby_size, mmr[i], 0))
+
+    def lobby_cost(lobby):
+        lobby = sorted(lobby)
+        top2 = [()] * len(role_names)
+        for i in lobby:
+            top2 = merge_top2(top2, roles[i])
+        return cost(mmr[lobby[-1]] - mmr[lobby[0]], top2, sum(wait[i] for i in lobby))
+
+    # Good first guess makes the search cut a lot more:
+    # best mmr window of 10 players improved by single player swaps.
+    windows = [
+        list(range(i, i + lobby_size)) for i in range(n - lobby_size + 1)
+        if oldest is None or i <= oldest < i + lobby_size
+    ]
+    lobby = min(windows, key=lobby_cost)
+    best = [lobby_cost(lobby), lobby]
+    improved = True
+    while improved:
+        improved = False
+        for out_pos, out in enumerate(best[1]):
+            if out == oldest:
+                continue
+            for x in set(range(n)) - set(best[1]):
+                lobby = best[1][:out_pos] + [x] + best[1][out_pos + 1:]
+                new_cost = lobby_cost(lobby)
+                if new_cost < best[0]:
+                    best = [new_cost, lobby]
+                    improved = True
+                    break
+            if improved:
+                break
+
+    best = [best[0], sorted(best[1])]
+    chosen = []
+    nodes = [0]
+
+    def search(i, top2, wait_sum):
+        left = lobby_size - len(chosen)
+        if left == 0:
+            if oldest is not None and oldest not in chosen:
+                return  # lobby filled up before reaching the oldest player
+
+            lobby_cost = cost(mmr[chosen[-1]] - mmr[chosen[0]], top2, wait_sum)
+            if lobby_cost < best[0]:
+                best[:] = [lobby_cost, list(chosen)]
+            return
+
+        if n - i < left or nodes[0] >= max_nodes:
+            return
+        nodes[0] += 1
+
+        # lower bound of the cost for any lobby completed from here
+        coverage = (max_coverage - role_coverage(merge_top2(top2, suffix_top2[i]))) * roles_weight
+        if chosen:
+            bound = coverage + spread_wait_bound(i, left, mmr[chosen[0]], wait_sum)
+        else:
+            bound = coverage + window_bound[i]
+        if bound >= best[0]:
+            return
+
+        # take player i
+        chosen.append(i)
+        search(i + 1, merge_top2(top2, roles[i]), wait_sum + wait[i])
+        chosen.pop()
+
+        # skip player i
+        if i != oldest:
+            search(i + 1, top2, wait_sum)
+
+    search(0, [()] * len(role_names), 0)
+
+    if best[1] is None:
+        return None, None
+    return [candidates[i] for i in best[1]], best[0]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 10:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('balancer', '0007_auto_20240223_1842'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='balanceresult',
+            name='answers_total',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='balanceresult',
+            name='players',
+            field=jsonfield.fields.JSONField(blank=True, null=True),
+        ),
+    ]
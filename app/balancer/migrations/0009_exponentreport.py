@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 14:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('balancer', '0008_auto_20261018_1000'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExponentReport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('seasons', jsonfield.fields.JSONField()),
+                ('matches', models.PositiveIntegerField()),
+                ('recommended', models.FloatField()),
+                ('report', jsonfield.fields.JSONField()),
+            ],
+        ),
+    ]
@@ -9,6 +9,11 @@ from jsonfield import JSONField
 class BalanceResult(models.Model):
     mmr_exponent = models.FloatField(default=3)
 
+    # balancer input, used to generate answers that were not saved
+    players = JSONField(null=True, blank=True)
+    # total number of answers (saved or not); null if not known yet
+    answers_total = models.PositiveSmallIntegerField(null=True, blank=True)
+
 
 # BalanceAsnwer is a single way to make 2 teams out of 10 players
 class BalanceAnswer(models.Model):
@@ -20,3 +25,13 @@ class BalanceAnswer(models.Model):
     mmr_diff = models.BigIntegerField()
     mmr_diff_exp = models.BigIntegerField()
     result = models.ForeignKey(BalanceResult, related_name='answers', null=True)
+
+
+# evaluation of candidate balance exponents on recorded matches,
+# made by tune_balance_exponent command
+class ExponentReport(models.Model):
+    date = models.DateTimeField(auto_now_add=True)
+    seasons = JSONField()
+    matches = models.PositiveIntegerField()
+    recommended = models.FloatField()
+    report = JSONField()
@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.balancer.balancer import role_names, role_permutations
+
+
+team_players = len(role_names)
+
+# carry and mid can't go to a player this much lower than team's top2 mmr
+core_mmr_gap = 1500
+
+# Permutation tables are built once, at import:
+#   permutation_roles[p, s] - role index assigned to team slot s in permutation p
+#   permutation_onehot[p, s, r] - 1 if slot s gets role r in permutation p
+#   permutation_core[p, s] - slot s gets carry or mid in permutation p
+permutation_roles = np.array([[role_names.index(r) for r in roles] for roles in role_permutations])
+permutation_onehot = np.eye(team_players, dtype=np.int64)[permutation_roles]
+permutation_core = np.isin(permutation_roles, [role_names.index('carry'), role_names.index('mid')])
+
+
+def assign_roles(teams, mmr, roles):
+    """
+    Finds the best legal role permutation for many teams at once.
+
+    :param teams: Nx5 array of player indices, each team sorted by mmr desc
+    :param mmr: players mmr vector
+    :param roles: players x role_names matrix of role preferences
+    :return: (Nx5 role index for each team slot, Nx5 role score for each slot)
+    """
+    teams_roles = roles[teams]  # N x slot x role
+
+    # role score of every permutation for every team
+    scores = np.einsum('tsr,psr->tp', teams_roles, permutation_onehot)
+
+    # mask permutations that give a core role to a low mmr player
+    teams_mmr = mmr[teams]
+    low_mmr = teams_mmr[:, 1:2] - teams_mmr >= core_mmr_gap
+    illegal = low_mmr.astype(np.int64) @ permutation_core.T > 0
+    scores[illegal] = -1
+
+    # argmax takes the first best permutation, same as balancer.py
+    best = scores.argmax(axis=1)
+    best_roles = permutation_roles[best]
+
+    return best_roles, np.take_along_axis(teams_roles, best_roles[:, :, None], axis=2)[:, :, 0]
@@ -0,0 +1,38 @@
+import random
+
+from app.balancer.balancer import role_names, BalancerPlayer
+
+
+def synthetic_player(rnd, player_id):
+    """
+    Random player that looks like a real ladder player:
+    mmr is normally distributed around 4000,
+    role preferences lean either to core or to support roles.
+    """
+    mmr = int(min(9000, max(500, rnd.gauss(4000, 1200))))
+
+    core = rnd.random() < 0.5
+    roles = []
+    for i in range(len(role_names)):
+        favourite = (i < 3) == core  # first 3 roles are cores
+        pref = rnd.gauss(4 if favourite else 2, 1)
+        roles.append(int(min(5, max(1, round(pref)))))
+
+    return BalancerPlayer(player_id, f'Player {player_id}', mmr, roles)
+
+
+def synthetic_players(seed, count=10):
+    """
+    Seeded list of synthetic players; same seed gives same players.
+    Players only have attributes used by balancer, no database needed.
+    """
+    rnd = random.Random(seed)
+    return [synthetic_player(rnd, i) for i in range(count)]
+
+
+def synthetic_teams(seed):
+    """
+    Seeded pair of teams in balance_from_teams() format.
+    """
+    players = [(p.name, p.ladder_mmr) for p in synthetic_players(seed)]
+    return [players[:5], players[5:]]
@@ -1,3 +1,193 @@
-from django.test import TestCase
+import itertools
+import random
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from app.balancer import balancer, matchmaker, vectorized
+from app.balancer.cache import BalanceCache
+from app.balancer.synthetic import synthetic_players
+from app.ladder.models import LadderSettings
+
+
+class SelectPlayersTest(SimpleTestCase):
+    @staticmethod
+    def brute_force(candidates, keep_oldest):
+        oldest = max(candidates, key=lambda c: c.wait)
+
+        best = None
+        for lobby in itertools.combinations(candidates, matchmaker.lobby_size):
+            if keep_oldest and oldest not in lobby:
+                continue
+
+            mmr = [c.player.ladder_mmr for c in lobby]
+            top2 = [
+                tuple(sorted((getattr(c.player.roles, r) for c in lobby), reverse=True)[:2])
+                for r in matchmaker.role_names
+            ]
+            cost = (max(mmr) - min(mmr)) * matchmaker.spread_weight + \
+                (matchmaker.max_coverage - matchmaker.role_coverage(top2)) * matchmaker.roles_weight - \
+                sum(c.wait for c in lobby) * matchmaker.wait_weight
+            if best is None or cost < best:
+                best = cost
+
+        return best
+
+    def test_matches_brute_force(self):
+        for seed in range(150):
+            rnd = random.Random(seed)
+            players = synthetic_players(seed, rnd.randint(10, 14))
+            candidates = [matchmaker.Candidate(p, rnd.uniform(0, 30)) for p in players]
+            oldest = max(candidates, key=lambda c: c.wait)
+
+            for keep_oldest in (True, False):
+                with self.subTest(seed=seed, keep_oldest=keep_oldest):
+                    lobby, cost = matchmaker.select_players(candidates, keep_oldest)
+
+                    self.assertEqual(len(lobby), matchmaker.lobby_size)
+                    self.assertAlmostEqual(cost, self.brute_force(candidates, keep_oldest))
+                    if keep_oldest:
+                        self.assertIn(oldest, lobby)
+
+    def test_node_budget(self):
+        rnd = random.Random(0)
+        players = synthetic_players(0, 30)
+        candidates = [matchmaker.Candidate(p, rnd.uniform(0, 30)) for p in players]
+        oldest = max(candidates, key=lambda c: c.wait)
+
+        # out of budget right away, the first guess is returned
+        lobby, cost = matchmaker.select_players(candidates, max_nodes=0)
+        full_lobby, full_cost = matchmaker.select_players(candidates, max_nodes=10 ** 9)
+
+        self.assertEqual(len(lobby), matchmaker.lobby_size)
+        self.assertIn(oldest, lobby)
+        self.assertGreaterEqual(cost, full_cost)
+
+
+class BalancerEnginesTest(SimpleTestCase):
+    policies = [LadderSettings.LADDER_POLICY, LadderSettings.FRONT_ROLES_POLICY, LadderSettings.FRONT_MMR_POLICY]
+
+    @staticmethod
+    def normalize(answers):
+        # team sides are random, compare teams in a fixed order
+        return [
+            (
+                a['mmr_diff'], a['mmr_diff_exp'], a['role_score_sum'],
+                sorted((t['players'], t['role_score'], t['role_score_sum']) for t in a['teams']),
+            )
+            for a in answers
+        ]
+
+    def assertSameAnswers(self, players, **options):
+        answers = balancer.role_balance_teams(list(players), **options)
+        answers_np = vectorized.role_balance_teams(list(players), **options)
+
+        self.assertEqual(self.normalize(answers), self.normalize(answers_np))
+        return answers
+
+    def test_policies_and_limits(self):
+        for seed in range(10):
+            players = synthetic_players(seed)
+            for policy, limit in itertools.product(self.policies, [None, 1, 5]):
+                with self.subTest(seed=seed, policy=policy, limit=limit):
+                    answers = self.assertSameAnswers(players, policy=policy, limit=limit)
+                    if limit:
+                        self.assertLessEqual(len(answers), limit)
+
+    def test_exponents(self):
+        players = synthetic_players(0)
+        for exponent in (1, 3, 2.5, 8):
+            with self.subTest(exponent=exponent):
+                self.assertSameAnswers(players, mmr_exponent=exponent, limit=10)
+
+    def test_apart_together(self):
+        for seed in range(10):
+            players = synthetic_players(seed)
+            rnd = random.Random(seed)
+            ids = [p.id for p in players]
+
+            cases = [
+                {'apart': [tuple(rnd.sample(ids, 2))]},
+                {'together': [tuple(rnd.sample(ids, 2))]},
+                {'apart': [tuple(rnd.sample(ids, 2))], 'together': [tuple(rnd.sample(ids, 2))]},
+                # 6 players can't be together, constraints are ignored
+                {'together': list(zip(ids[:5], ids[1:6]))},
+            ]
+            for options in cases:
+                with self.subTest(seed=seed, **options):
+                    answers = self.assertSameAnswers(players, **options)
+                    self.assertTrue(answers)
+
+            with self.subTest(seed=seed, constraints='ignored'):
+                ignored = balancer.role_balance_teams(list(players), together=list(zip(ids[:5], ids[1:6])))
+                plain = balancer.role_balance_teams(list(players))
+                self.assertEqual(self.normalize(ignored), self.normalize(plain))
+
+    def test_team_roles_cache(self):
+        for seed in range(5):
+            players = synthetic_players(seed)
+            expected = self.normalize(balancer.role_balance_teams(list(players)))
+
+            with self.subTest(seed=seed):
+                # cache is filled by one engine and used by the other
+                for first, second in [(balancer, vectorized), (vectorized, balancer)]:
+                    cache = BalanceCache(maxsize=1000)
+                    cold = first.role_balance_teams(list(players), team_roles=cache)
+                    warm = second.role_balance_teams(list(players), team_roles=cache)
+
+                    self.assertEqual(self.normalize(cold), expected)
+                    self.assertEqual(self.normalize(warm), expected)
+
+                # substitution: teams of remaining players come from cache
+                cache = BalanceCache(maxsize=1000)
+                balancer.role_balance_teams(list(players), team_roles=cache)
+                substituted = players[:9] + synthetic_players(seed + 100, 11)[10:]
+                self.assertSameAnswers(substituted, team_roles=cache)
+
+
+class RankAnswersTest(SimpleTestCase):
+    @staticmethod
+    def random_answers(rnd, count):
+        # small value ranges, so there are a lot of ties
+        return [
+            {
+                'id': i,
+                'role_score_sum': rnd.randint(30, 36),
+                'mmr_diff_exp': rnd.randint(0, 8),
+                'mmr_diff': rnd.randint(0, 8),
+            }
+            for i in range(count)
+        ]
+
+    @staticmethod
+    def pareto_brute_force(answers):
+        def dominates(a, b):
+            no_worse = a['role_score_sum'] >= b['role_score_sum'] and \
+                a['mmr_diff_exp'] <= b['mmr_diff_exp'] and a['mmr_diff'] <= b['mmr_diff']
+            better = a['role_score_sum'] > b['role_score_sum'] or \
+                a['mmr_diff_exp'] < b['mmr_diff_exp'] or a['mmr_diff'] < b['mmr_diff']
+            return no_worse and better
+
+        return [a for a in answers if not any(dominates(b, a) for b in answers)]
+
+    def test_pareto_front(self):
+        for seed in range(300):
+            rnd = random.Random(seed)
+            answers = self.random_answers(rnd, rnd.randint(0, 60))
+
+            with self.subTest(seed=seed):
+                self.assertEqual(balancer.pareto_front(answers), self.pareto_brute_force(answers))
+
+    def test_rank_answers(self):
+        def key(x):
+            return -x['role_score_sum'], x['mmr_diff_exp']
+
+        for seed in range(100):
+            rnd = random.Random(seed)
+            answers = self.random_answers(rnd, rnd.randint(0, 60))
+
+            for limit in (None, 0, 1, 5, 100):
+                with self.subTest(seed=seed, limit=limit):
+                    expected = sorted(answers, key=key)
+                    if limit is not None:
+                        expected = expected[:limit]
+                    self.assertEqual(balancer.rank_answers(answers, key, limit), expected)
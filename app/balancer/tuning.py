@@ -0,0 +1,124 @@
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.balancer.balancer import balance_teams
+
+
+default_exponents = [1, 1.5, 2, 2.5, 3, 3.5, 4, 5]
+
+# log loss differences this small are noise for a few thousand matches,
+# among such exponents the one closest to current balancing is recommended
+log_loss_tolerance = 0.002
+
+# recommendation that would give other teams to most lobbies is reported with a warning
+changed_teams_warning = 0.5
+
+
+def load_lobbies(seasons):
+    """
+    Loads teams and winners of recorded matches.
+
+    :return: list of lobbies, each is ([team 0 players, team 1 players], winner),
+             players are (name, mmr) at the time of the match
+    """
+    from app.ladder.models import Match
+
+    matches = Match.objects.filter(season__in=seasons, balance__isnull=False)\
+        .select_related('balance').only('winner', 'balance__teams').order_by('id')
+
+    lobbies = []
+    for match in matches.iterator():
+        teams = [[tuple(p) for p in team['players']] for team in match.balance.teams]
+        if [len(team) for team in teams] == [5, 5]:
+            lobbies.append((teams, match.winner))
+
+    return lobbies
+
+
+def fit_logistic(x, y, iterations=25):
+    """
+    Fits P(y=1) = 1 / (1 + exp(-k * x)) with Newton's method.
+    :return: (k, mean log loss)
+    """
+    k = 0.0
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-k * x))
+        grad = np.sum((p - y) * x)
+        hess = np.sum(p * (1 - p) * x * x)
+        if hess <= 0:
+            break
+        k -= grad / hess
+
+    p = np.clip(1 / (1 + np.exp(-k * x)), 1e-9, 1 - 1e-9)
+    log_loss = -np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))
+
+    return k, log_loss
+
+
+def evaluate_exponent(exponent, lobbies):
+    """
+    Scores exponent on recorded matches:
+        - how well exponent mmr diff of played teams predicts the winner
+          (accuracy and log loss of a fitted logistic curve);
+        - how often balancer with this exponent would make other teams
+          from the same 10 players.
+
+    First score is predictive fit on teams that were actually played
+    (made by the exponent used at the time), not quality of the teams
+    balancer would make with this exponent: those were never played.
+    """
+    mmr = np.array([[[p[1] for p in team] for team in teams] for teams, _ in lobbies], dtype=float)
+    team0_won = np.array([winner == 0 for _, winner in lobbies], dtype=float)
+
+    # exponent mmr diff, brought back to mmr units, so exponents can be compared
+    # (first order: x ** e grows by e * x ** (e - 1) per mmr point)
+    diff_exp = (mmr[:, 0] ** exponent).mean(axis=1) - (mmr[:, 1] ** exponent).mean(axis=1)
+    diff = diff_exp / (exponent * mmr.mean(axis=(1, 2)) ** (exponent - 1))
+
+    correct = np.where(diff == 0, 0.5, (diff > 0) == team0_won)
+    _, log_loss = fit_logistic(diff / 100, team0_won)
+
+    # rerun balancer, sides don't matter here
+    random.seed(0)
+    changed = 0
+    for teams, _ in lobbies:
+        answer = balance_teams(teams[0] + teams[1], exponent, limit=1)[0]
+        played = {frozenset(p[0] for p in team) for team in teams}
+        balanced = {frozenset(p[0] for p in team['players']) for team in answer['teams']}
+        changed += played != balanced
+
+    return {
+        'exponent': exponent,
+        'accuracy': float(correct.mean()),
+        'log_loss': float(log_loss),
+        'changed_teams': changed / len(lobbies),
+    }
+
+
+def _evaluate(args):
+    return evaluate_exponent(*args)
+
+
+def tune_exponent(lobbies, exponents=None, workers=None):
+    """
+    Evaluates candidate exponents in a process pool.
+
+    Recommends exponent with the best log loss, but among exponents
+    within log_loss_tolerance of it takes the one that changes fewest teams:
+    fit is measured on played teams only, so it can't tell apart exponents
+    that fit equally well, while changing teams is a real cost.
+
+    :return: (recommended exponent, list of evaluations)
+    """
+    exponents = exponents or default_exponents
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        report = list(pool.map(_evaluate, [(e, lobbies) for e in exponents]))
+
+    best_loss = min(r['log_loss'] for r in report)
+    close = [r for r in report if r['log_loss'] <= best_loss + log_loss_tolerance]
+
+    best = min(close, key=lambda r: (r['changed_teams'], r['log_loss'], -r['accuracy']))
+    return best['exponent'], report
@@ -0,0 +1,155 @@
+import itertools
+import random
+from typing import List
+
+import numpy as np
+
+from app.balancer.balancer import role_names, select_answers, pair_masks, team_key
+from app.balancer.role_assignment import assign_roles
+from app.ladder.models import Player, LadderSettings
+
+
+team_players = 5
+
+# all ways to pick a team out of 10 players (indices into players sorted by mmr)
+team_combinations = np.array(list(itertools.combinations(range(team_players * 2), team_players)))
+
+# bitmask of players in each team
+team_masks = (1 << team_combinations).sum(axis=1)
+
+
+def players_to_arrays(players: List[Player], mmr_exponent=3):
+    """
+    Loads players into arrays:
+        - mmr vector
+        - mmr ** exponent vector
+        - 10x5 role preference matrix (players x role_names)
+
+    Exponent MMR is kept as int64 when it fits, otherwise
+    python numbers are used so results match balancer.py exactly.
+    """
+    mmrs = [p.ladder_mmr for p in players]
+
+    mmr = np.array(mmrs, dtype=np.int64)
+    if isinstance(mmr_exponent, int) and \
+       max(mmrs) ** mmr_exponent * team_players <= np.iinfo(np.int64).max:
+        mmr_exp = mmr ** mmr_exponent
+    else:
+        mmr_exp = np.array([m ** mmr_exponent for m in mmrs], dtype=object)
+
+    roles = np.array([
+        [getattr(p.roles, r) for r in role_names]
+        for p in players
+    ], dtype=np.int64)
+
+    return mmr, mmr_exp, roles
+
+
+def assign_roles_cached(teams, players, mmr, roles, cache):
+    """
+    assign_roles() that takes roles of already seen teams from cache
+    (shared with balancer.role_balance_teams) and scores only the new ones.
+    """
+    keys = [team_key([players[i] for i in team]) for team in teams.tolist()]
+    cached = [cache.get(key) for key in keys]
+    missing = [i for i, c in enumerate(cached) if not c]
+
+    best_roles = np.empty_like(teams)
+    if missing:
+        best_roles[missing], _ = assign_roles(teams[missing], mmr, roles)
+
+        for i, team_roles in zip(missing, best_roles[missing].tolist()):
+            role_score = int(roles[teams[i], team_roles].sum())
+            cache.put(keys[i], (tuple(role_names[r] for r in team_roles), role_score))
+
+    for i, c in enumerate(cached):
+        if c:
+            best_roles[i] = [role_names.index(r) for r in c[0]]
+
+    return best_roles, roles[teams, best_roles]
+
+
+def role_balance_teams(players: List[Player], mmr_exponent=3, limit=None, apart=(), together=(),
+                       team_roles=None, policy=LadderSettings.LADDER_POLICY):
+    """
+    Same as balancer.role_balance_teams(), but scores all
+    team combinations with array operations.
+    Produces exactly the same list of answers.
+    """
+    # sort players by mmr
+    players.sort(key=lambda x: -x.ladder_mmr)
+
+    mmr, mmr_exp, roles = players_to_arrays(players, mmr_exponent)
+
+    # calc avg MMR for each team
+    teams_mmr = (mmr[team_combinations].sum(axis=1) // team_players).tolist()
+    teams_mmr_exp = (mmr_exp[team_combinations].sum(axis=1) // team_players).tolist()
+
+    # combine teams into pairs against each other;
+    # combinations are ordered, so team i plays against team (n-1-i)
+    half = len(team_combinations) // 2
+    radiant = np.arange(half)
+    dire = np.arange(len(team_combinations) - 1, half - 1, -1)
+
+    # discard answers that place top 2 or lowest 2 players on same team
+    # (first half of combinations always contains the top player)
+    in_team = np.zeros((len(team_combinations), len(players)), dtype=bool)
+    in_team[np.arange(len(team_combinations))[:, None], team_combinations] = True
+    ok = in_team[radiant, 0] != in_team[radiant, 1]
+    ok &= in_team[radiant, -1] != in_team[radiant, -2]
+    radiant, dire = radiant[ok], dire[ok]
+
+    # discard answers that break blacklist or premade constraints;
+    # if none of answers satisfies them, constraints are ignored
+    apart = np.array(pair_masks(players, apart), dtype=np.int64)
+    together = np.array(pair_masks(players, together), dtype=np.int64)
+    if len(apart) or len(together):
+        masks = team_masks[radiant, None]
+        feasible = ((masks & apart != 0) & (masks & apart != apart)).all(axis=1)
+        feasible &= ((masks & together == 0) | (masks & together == together)).all(axis=1)
+
+        if feasible.any():
+            radiant, dire = radiant[feasible], dire[feasible]
+
+    # assign roles for all teams in one pass
+    used = np.concatenate([radiant, dire])
+    if team_roles is None:
+        teams_roles, teams_role_score = assign_roles(team_combinations[used], mmr, roles)
+    else:
+        teams_roles, teams_role_score = assign_roles_cached(team_combinations[used], players, mmr, roles, team_roles)
+
+    # sort players according to their roles
+    slots = np.argsort(teams_roles, axis=1)
+    teams_players = np.take_along_axis(team_combinations[used], slots, axis=1).tolist()
+    teams_role_score = np.take_along_axis(teams_role_score, slots, axis=1).tolist()
+
+    # team index -> its players and role scores
+    teams_players = dict(zip(used.tolist(), teams_players))
+    teams_role_score = dict(zip(used.tolist(), teams_role_score))
+
+    def team_info(i):
+        return {
+            'players': [players[x] for x in teams_players[i]],
+            'mmr': teams_mmr[i],
+            'mmr_exp': teams_mmr_exp[i],
+            'role_score': teams_role_score[i],
+            'role_score_sum': sum(teams_role_score[i]),
+        }
+
+    answers = []
+    for r, d in zip(radiant.tolist(), dire.tolist()):
+        answer = (team_info(r), team_info(d))
+        answers.append({
+            'teams': random.sample(answer, len(answer)),  # assign team side randomly (Radiant or Dire)
+            'mmr_diff': abs(answer[0]['mmr'] - answer[1]['mmr']),
+            'mmr_diff_exp': abs(answer[0]['mmr_exp'] - answer[1]['mmr_exp']),
+            'role_score_sum': answer[0]['role_score_sum'] + answer[1]['role_score_sum'],
+        })
+
+    answers = select_answers(answers, policy, limit)
+
+    for answer in answers:
+        for team in answer['teams']:
+            team['players'] = [(p.name, p.ladder_mmr) for p in team['players']]
+
+    return answers
@@ -62,6 +62,28 @@ class RecordMatch(FormView):
         return reverse('balancer:balancer-answer', args=(self.answer.id,))
 
 
+class ResultAnswers:
+    """
+    Answers of a BalanceResult for paginator.
+    Only the best answers are saved when balancing,
+    the rest are generated when some page needs them.
+    """
+    def __init__(self, result):
+        self.result = result
+
+    def __len__(self):
+        if self.result.answers_total is None:
+            BalanceResultManager.load_answers(self.result, 0)
+
+        return self.result.answers_total or self.result.answers.count()
+
+    def __getitem__(self, item):
+        stop = item.stop if isinstance(item, slice) else item + 1
+        BalanceResultManager.load_answers(self.result, stop)
+
+        return self.result.answers.order_by('id')[item]
+
+
 class BalancerResult(DetailView):
     model = BalanceResult
     template_name = 'balancer/balancer-result.html'
@@ -73,7 +95,7 @@ class BalancerResult(DetailView):
         # paginate
         page_num = self.request.GET.get('page', 1)
         try:
-            answers = context['result'].answers.all()
+            answers = ResultAnswers(context['result'])
             page = Paginator(answers, 1, request=self.request).page(page_num)
         except PageNotAnInteger:
             raise Http404
@@ -2,7 +2,7 @@ from django import forms
 from django_reverse_admin import ReverseModelAdmin
 
 from app.ladder.models import Player, Match, MatchPlayer, ScoreChange, LadderSettings, LadderQueue, QueuePlayer, \
-    QueueChannel, RolesPreference, DiscordChannels, DiscordPoll, PlayerReport
+    QueueChannel, RolesPreference, DiscordChannels, DiscordPoll, PlayerReport, Job, PlayerSeasonStats, PlayerPairStats
 from django.contrib import admin
 from django.db.models import Prefetch
 from dal import autocomplete
@@ -103,6 +103,22 @@ class MatchAdmin(admin.ModelAdmin):
 
     list_display = ('date', 'dota_id')
 
+    def save_related(self, request, form, formsets, change):
+        match = form.instance
+        player_ids = set(match.matchplayer_set.values_list('player_id', flat=True))
+
+        super(MatchAdmin, self).save_related(request, form, formsets, change)
+
+        if change and not form.has_changed() and not any(f.has_changed() for f in formsets):
+            return
+
+        # players or winner could change, stats of old and new players are computed again
+        player_ids |= set(match.matchplayer_set.values_list('player_id', flat=True))
+        seasons = {match.season, form.initial.get('season', match.season)}
+        for season in seasons:
+            PlayerSeasonStats.objects.rebuild(season, player_ids)
+        PlayerPairStats.objects.rebuild(player_ids)
+
 
 class PlayerReportAdmin(admin.ModelAdmin):
     list_display = ('from_player', 'to_player', 'comment', 'value', 'report_date')
@@ -193,6 +209,13 @@ class DiscordPollAdmin(admin.ModelAdmin):
     list_display = ('name', 'message_id')
 
 
+class JobAdmin(admin.ModelAdmin):
+    model = Job
+
+    list_display = ('id', 'kind', 'status', 'attempts', 'locked_by', 'created', 'finished', 'duration')
+    list_filter = ('kind', 'status')
+
+
 admin.site.register(Player, PlayerAdmin)
 admin.site.register(ScoreChange, ScoreChangeAdmin)
 admin.site.register(Match, MatchAdmin)
@@ -206,4 +229,6 @@ admin.site.register(QueueChannel, QueueChannelAdmin)
 admin.site.register(DiscordChannels, SingletonModelAdmin)
 admin.site.register(DiscordPoll, DiscordPollAdmin)
 
+admin.site.register(Job, JobAdmin)
+
 # admin.site.register(Player.blacklist.through)
@@ -0,0 +1,178 @@
+import numpy as np
+from django.core.cache import cache
+
+
+# buckets of team mmr difference (left edges)
+mmr_diff_buckets = [0, 1, 50, 100, 150, 200, 300, 400]
+
+# expected win probability of the team with higher mmr,
+# same logistic curve as Elo rating: mmr_diff of 400 means 10 to 1
+elo_scale = 400
+
+# calibration bins of expected win probability of the favourite (left edges)
+calibration_bins = [0.5, 0.55, 0.6, 0.65, 0.7, 0.75]
+
+
+def expected_win(mmr_diff):
+    return 1 / (1 + 10 ** (-np.asarray(mmr_diff, dtype=float) / elo_scale))
+
+
+def exp_mmr_diff(teams, mmr_exponent):
+    """
+    Difference of team 0 and team 1 in exponent mmr (what balancer minimises),
+    brought back to mmr units, so the same Elo curve applies to it
+    (first order: x ** e grows by e * x ** (e - 1) per mmr point).
+    """
+    mmrs = [[p[1] for p in team['players']] for team in teams]
+    means = [sum(m ** mmr_exponent for m in team) / len(team) for team in mmrs]
+    avg = sum(sum(team) for team in mmrs) / sum(len(team) for team in mmrs)
+    if avg <= 0:
+        return 0
+
+    return (means[0] - means[1]) / (mmr_exponent * avg ** (mmr_exponent - 1))
+
+
+def fold_calibration(stats, prefix, mmr_diff, winner):
+    favourite_won = np.where(mmr_diff > 0, winner == 0, winner == 1)
+    abs_diff = np.abs(mmr_diff)
+
+    # even games have no favourite
+    expected = expected_win(abs_diff)[abs_diff > 0]
+    won = favourite_won[abs_diff > 0]
+    bins = np.digitize(expected, calibration_bins) - 1
+    stats[f'{prefix}_games'] += np.bincount(bins, minlength=len(calibration_bins))
+    stats[f'{prefix}_expected'] += np.bincount(bins, weights=expected, minlength=len(calibration_bins))
+    stats[f'{prefix}_wins'] += np.bincount(bins, weights=won, minlength=len(calibration_bins))\
+        .astype(np.int64)
+
+
+def fold_matches(stats, mmr_diff, mmr_diff_exp, winner):
+    """
+    Adds matches to stats counters in one vectorized pass.
+
+    :param mmr_diff: array of team 0 mmr - team 1 mmr
+    :param mmr_diff_exp: array of team 0 - team 1 exponent mmr, see exp_mmr_diff()
+    :param winner: array of winning teams
+    """
+    favourite_won = np.where(mmr_diff > 0, winner == 0, winner == 1)
+    abs_diff = np.abs(mmr_diff)
+
+    buckets = np.digitize(abs_diff, mmr_diff_buckets) - 1
+    stats['games'] += np.bincount(buckets, minlength=len(mmr_diff_buckets))
+    stats['favourite_wins'] += np.bincount(buckets, weights=favourite_won, minlength=len(mmr_diff_buckets))\
+        .astype(np.int64)
+
+    fold_calibration(stats, 'calibration', mmr_diff, winner)
+    fold_calibration(stats, 'calibration_exp', mmr_diff_exp, winner)
+
+
+def empty_stats():
+    stats = {
+        'last_match': 0,
+        'matches': 0,
+        'games': np.zeros(len(mmr_diff_buckets), dtype=np.int64),
+        'favourite_wins': np.zeros(len(mmr_diff_buckets), dtype=np.int64),
+    }
+    for prefix in ('calibration', 'calibration_exp'):
+        stats[f'{prefix}_games'] = np.zeros(len(calibration_bins), dtype=np.int64)
+        stats[f'{prefix}_expected'] = np.zeros(len(calibration_bins))
+        stats[f'{prefix}_wins'] = np.zeros(len(calibration_bins), dtype=np.int64)
+
+    return stats
+
+
+def season_stats(season):
+    """
+    Balance quality counters of a season.
+    Counters are kept in cache, and only matches recorded since
+    the last call are added to them. If some matches were deleted,
+    counters are computed again.
+    """
+    from app.ladder.models import Match
+
+    key = f'balance_quality_{season}'
+    stats = cache.get(key)
+
+    matches = Match.objects.filter(season=season, balance__isnull=False)
+    if stats is None or stats.keys() != empty_stats().keys() or \
+            matches.filter(id__lte=stats['last_match']).count() != stats['matches']:
+        stats = empty_stats()
+        cache.delete(key)
+
+    new = matches.filter(id__gt=stats['last_match'])\
+        .select_related('balance__result')\
+        .only('id', 'winner', 'balance__teams', 'balance__result__mmr_exponent').order_by('id')
+    # answers without a result were made with the default exponent
+    new = [(m.id, m.winner, m.balance.teams, m.balance.result.mmr_exponent if m.balance.result else 3)
+           for m in new]
+
+    if new:
+        fold_matches(
+            stats,
+            mmr_diff=np.array([teams[0]['mmr'] - teams[1]['mmr'] for _, _, teams, _ in new], dtype=np.int64),
+            mmr_diff_exp=np.array([exp_mmr_diff(teams, exponent) for _, _, teams, exponent in new]),
+            winner=np.array([winner for _, winner, _, _ in new], dtype=np.int64),
+        )
+        stats['last_match'] = new[-1][0]
+        stats['matches'] += len(new)
+
+    if new or key not in cache:
+        cache.set(key, stats)
+
+    return stats
+
+
+def balance_quality(seasons):
+    """
+    Win rates by mmr diff, underdog win rate and calibration
+    of expected win probability for matches of given seasons.
+
+    Buckets and the first calibration use plain mmr diff, the one players see.
+    Balancer picks teams by exponent mmr diff, so calibration is also
+    reported for it (calibration_exp): if it predicts winners better,
+    exponent is doing its job.
+    """
+    stats = empty_stats()
+    for season in seasons:
+        for name, value in season_stats(season).items():
+            if name != 'last_match':
+                stats[name] += value
+
+    def percent(wins, games):
+        return 100 * wins / games if games else None
+
+    edges = mmr_diff_buckets + [None]
+    buckets = [
+        {
+            'caption': 'even' if low == 0 else (f'{low}-{high - 1}' if high else f'{low}+'),
+            'games': int(games),
+            'favourite_win_rate': percent(wins, games) if low else None,
+            'underdog_win_rate': percent(games - wins, games) if low else None,
+        }
+        for low, high, games, wins in zip(edges, edges[1:], stats['games'], stats['favourite_wins'])
+    ]
+
+    def calibration(prefix):
+        edges = calibration_bins + [1]
+        return [
+            {
+                'caption': f'{low:.0%}-{high:.0%}',
+                'games': int(games),
+                'expected': percent(expected, games),
+                'actual': percent(wins, games),
+            }
+            for low, high, games, expected, wins in zip(
+                edges, edges[1:], stats[f'{prefix}_games'],
+                stats[f'{prefix}_expected'], stats[f'{prefix}_wins'])
+        ]
+
+    uneven_games = stats['games'][1:].sum()
+    underdog_wins = uneven_games - stats['favourite_wins'][1:].sum()
+
+    return {
+        'matches': stats['matches'],
+        'underdog_win_rate': percent(underdog_wins, uneven_games),
+        'buckets': buckets,
+        'calibration': calibration('calibration'),
+        'calibration_exp': calibration('calibration_exp'),
+    }
@@ -0,0 +1,78 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.ladder.models import Player, RolesPreference
+
+
+class Command(BaseCommand):
+    # compares per-player save() ranking with bulk update_ranks()
+    # on synthetic players; everything is rolled back afterwards
+    def add_arguments(self, parser):
+        parser.add_argument('-s', '--sizes',
+                            nargs='+', type=int, default=[1000, 10000, 50000])
+        parser.add_argument('--seed',
+                            nargs='?', type=int, default=0, const=0)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+
+        print('players   save() s   bulk s')
+        for size in options['sizes']:
+            with transaction.atomic():
+                self.create_players(rnd, size)
+
+                start = time.perf_counter()
+                Command.update_ranks_per_player()
+                per_player = time.perf_counter() - start
+
+                # reset ranks, so bulk update has to write every row too
+                Player.objects.update(rank_ladder_mmr=0, rank_score=0)
+
+                start = time.perf_counter()
+                Player.objects.update_ranks()
+                bulk = time.perf_counter() - start
+
+                transaction.set_rollback(True)
+
+            print(f'{size:7}  {per_player:9.2f}  {bulk:7.2f}')
+
+    @staticmethod
+    def create_players(rnd, size):
+        # bulk_create skips Player.save(), so roles are made here
+        RolesPreference.objects.bulk_create(RolesPreference() for _ in range(size))
+        roles = RolesPreference.objects.order_by('-id').values_list('id', flat=True)[:size]
+
+        Player.objects.bulk_create(
+            Player(
+                name=f'benchmark-{i}',
+                dota_mmr=0,
+                ladder_mmr=rnd.randint(1000, 7000),
+                score=rnd.randint(0, 100),
+                roles_id=roles_id,
+            )
+            for i, roles_id in enumerate(roles)
+        )
+
+    @staticmethod
+    def update_ranks_per_player():
+        # how ranks were updated before: full save() for every player and field
+        def update_ranks_by(field):
+            players.sort(key=lambda p: getattr(p, field), reverse=True)
+
+            ranks = [1]
+            for i in range(1, len(players)):
+                curr_val = getattr(players[i], field)
+                prev_val = getattr(players[i-1], field)
+                ranks.append(ranks[i-1] if curr_val == prev_val else i+1)
+
+            for i, player in enumerate(players):
+                setattr(player, f'rank_{field}', ranks[i])
+                player.save()
+
+        players = list(Player.objects.all())
+
+        update_ranks_by('ladder_mmr')
+        update_ranks_by('score')
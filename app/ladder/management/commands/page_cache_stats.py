@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+
+from app.ladder.page_cache import page_cache_stats
+
+
+class Command(BaseCommand):
+    # shows hit ratios and render times of cached ladder pages
+    views = [
+        'PlayerList', 'PlayersSuccessful', 'MatchList', 'LadderStats',
+        'PlayerOverview', 'PlayerScores', 'PlayerTeammates', 'PlayerOpponents',
+    ]
+
+    def handle(self, *args, **options):
+        print(f'{"view":<20} {"hits":>8} {"304s":>8} {"misses":>8} {"hit ratio":>10} {"avg render":>11}')
+        for view, s in page_cache_stats(self.views).items():
+            print(f'{view:<20} {s["hits"]:>8} {s["not_modified"]:>8} {s["misses"]:>8} '
+                  f'{s["hit_ratio"]:>10.1%} {s["avg_render_ms"]:>9.0f}ms')
@@ -0,0 +1,10 @@
+from django.core.management import BaseCommand
+
+from app.ladder.models import PlayerPairStats
+
+
+class Command(BaseCommand):
+    # computes teammates and opponents stats (PlayerPairStats) again from recorded matches
+    def handle(self, *args, **options):
+        count = PlayerPairStats.objects.rebuild()
+        print(f'{count} player pairs rebuilt.')
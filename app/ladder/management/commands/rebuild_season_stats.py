@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+from django.db.models import Max
+
+from app.ladder.models import PlayerSeasonStats, LadderSettings, Match
+
+
+class Command(BaseCommand):
+    # computes PlayerSeasonStats again from recorded matches
+    def add_arguments(self, parser):
+        parser.add_argument('--season', type=int, default=None)
+        parser.add_argument('--all', action='store_true', default=False)
+
+    def handle(self, *args, **options):
+        if options['all']:
+            last_season = Match.objects.aggregate(Max('season'))['season__max'] or 0
+            seasons = range(1, last_season + 1)
+        else:
+            seasons = [options['season'] or LadderSettings.get_solo().current_season]
+
+        for season in seasons:
+            count = PlayerSeasonStats.objects.rebuild(season)
+            print(f'Season {season}: stats of {count} players rebuilt.')
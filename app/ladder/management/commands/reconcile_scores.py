@@ -0,0 +1,18 @@
+from django.core.management import BaseCommand
+
+from app.ladder.models import Player
+
+
+class Command(BaseCommand):
+    # checks players' ladder_mmr and score against the sum of their ScoreChanges
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', default=False)
+
+    def handle(self, *args, **options):
+        drift = Player.objects.reconcile_scores(fix=not options['dry_run'])
+
+        for player_id, (mmr, score), (expected_mmr, expected_score) in drift:
+            print(f'Player {player_id}: mmr {mmr} -> {expected_mmr}, score {score} -> {expected_score}')
+
+        action = 'found' if options['dry_run'] else 'repaired'
+        print(f'{len(drift)} players with drifted totals {action}.')
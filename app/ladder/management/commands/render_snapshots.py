@@ -0,0 +1,10 @@
+from django.core.management import BaseCommand
+
+from app.ladder.snapshots import render_snapshots, snapshots_dir
+
+
+class Command(BaseCommand):
+    # renders leaderboard pages to static files (also done after each recorded match)
+    def handle(self, *args, **options):
+        files = render_snapshots()
+        print(f'{len(files)} snapshots written to {snapshots_dir}: {", ".join(files)}')
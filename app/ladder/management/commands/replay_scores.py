@@ -0,0 +1,46 @@
+import time
+
+from django.core.management import BaseCommand
+
+from app.ladder.models import LadderSettings, Player
+from app.ladder.replay import replay_season
+
+
+class Command(BaseCommand):
+    # rebuilds players' ladder_mmr and score from the ScoreChange log
+    # and reports players whose totals differ; --apply saves replayed totals.
+    # Past seasons are only replayed, players hold totals of current season.
+    def add_arguments(self, parser):
+        parser.add_argument('-s', '--season',
+                            nargs='?', type=int, default=None)
+        parser.add_argument('-b', '--batch-size',
+                            nargs='?', type=int, default=100000, const=100000)
+        parser.add_argument('--apply', action='store_true', default=False)
+
+    def handle(self, *args, **options):
+        current_season = LadderSettings.get_solo().current_season
+        season = options['season']
+        if season is None:
+            season = current_season
+
+        start = time.perf_counter()
+        totals = replay_season(season, options['batch_size'])
+        print(f'Replayed ScoreChanges in {time.perf_counter() - start:.1f} s.')
+
+        names = dict(Player.objects.filter(id__in=list(totals)).values_list('id', 'name'))
+
+        if season != current_season:
+            # player totals hold current season only, there is nothing to compare with
+            for player_id, (mmr, score) in sorted(totals.items()):
+                print(f'{player_id:6} {names.get(player_id, ""):20}  mmr {mmr:5}  score {score:4}')
+            print(f'{len(totals)} players in season {season}.')
+            return
+
+        drift = Player.objects.reconcile_scores(fix=options['apply'], expected=totals)
+
+        for player_id, (mmr, score), (new_mmr, new_score) in drift:
+            print(f'{player_id:6} {names[player_id]:20}  mmr {mmr:5} -> {new_mmr:5}  score {score:4} -> {new_score:4}')
+        print(f'{len(drift)} players differ from replayed totals in season {season}.')
+
+        if options['apply'] and drift:
+            print('Replayed totals saved.')
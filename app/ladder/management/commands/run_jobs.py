@@ -0,0 +1,43 @@
+import time
+
+import pytz
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from app.ladder.models import Job
+
+
+class Command(BaseCommand):
+    # runs deferred jobs (match recording, ranks, snapshots) in its own process,
+    # so bots don't wait for them; --stats shows job timings
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', default=False)
+        parser.add_argument('--stats', action='store_true', default=False)
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            statuses = dict(Job.STATUS_CHOICES)
+            print(f'{"kind":15} {"status":8} {"jobs":>6} {"avg s":>8} {"max s":>8}')
+            for s in Job.objects.stats():
+                print(f'{s["kind"]:15} {statuses[s["status"]]:8} {s["count"]:6} '
+                      f'{s["avg_duration"] or 0:8.3f} {s["max_duration"] or 0:8.3f}')
+            return
+
+        last_reconcile = None
+        while True:
+            # jobs of runners that died, there can be several runners
+            Job.objects.recover()
+
+            # player totals are checked against ScoreChanges every morning
+            dt = timezone.localtime(timezone.now(), pytz.timezone('CET'))
+            if dt.hour == 6 and last_reconcile != dt.date():
+                Job.objects.enqueue(Job.RECONCILE_SCORES, coalesce=True)
+                last_reconcile = dt.date()
+
+            count = Job.objects.run_pending()
+            if count:
+                print(f'{count} jobs done.')
+
+            if options['once']:
+                break
+            time.sleep(5)
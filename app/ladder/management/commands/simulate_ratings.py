@@ -0,0 +1,62 @@
+import os
+import time
+
+from django.core.management import BaseCommand
+
+from app.ladder.managers import MatchManager
+from app.ladder.models import LadderSettings
+from app.ladder.simulator import RatingParams, params_grid, load_season, run_grid
+
+
+class Command(BaseCommand):
+    # replays recorded matches of a season under a grid of rating parameters;
+    # doesn't change anything in the database
+    def add_arguments(self, parser):
+        parser.add_argument('-s', '--season',
+                            nargs='?', type=int, default=None)
+        parser.add_argument('--mmr-per-game', nargs='+', type=int, default=None)
+        parser.add_argument('--underdog-diff', nargs='+', type=int, default=None)
+        parser.add_argument('--underdog-bonus', nargs='+', type=int, default=None)
+        parser.add_argument('--underdog-bonus-max', nargs='+', type=int, default=None)
+        parser.add_argument('--use-boundary', nargs='+', type=int, default=[0, 1])
+        parser.add_argument('-w', '--workers',
+                            nargs='?', type=int, default=os.cpu_count(), const=os.cpu_count())
+
+    def handle(self, *args, **options):
+        ladder = LadderSettings.get_solo()
+        season = options['season'] or ladder.current_season
+
+        # values that are used now, ranks churn is measured against them
+        current = RatingParams(
+            mmr_per_game=ladder.mmr_per_game,
+            underdog_diff=MatchManager.underdog_diff,
+            underdog_bonus=MatchManager.underdog_bonus,
+            underdog_bonus_max=MatchManager.underdog_bonus_max,
+            use_boundary=0,
+        )
+        grid = params_grid(**{
+            name: options[name] or [getattr(current, name)]
+            for name in RatingParams._fields
+        })
+
+        start = time.perf_counter()
+        season_data = load_season(season)
+        print(f'Season {season}: {len(season_data["winner"])} matches, '
+              f'{len(season_data["players"])} players, loaded in {time.perf_counter() - start:.1f} s.')
+
+        if not len(season_data['winner']):
+            return
+
+        start = time.perf_counter()
+        results = run_grid(season_data, grid, current, options['workers'])
+        print(f'Simulated {len(grid)} parameter sets in {time.perf_counter() - start:.1f} s.')
+        print()
+
+        print(f'{"mmr/game":>8} {"ud diff":>7} {"ud bonus":>8} {"ud max":>6} {"bound":>5} |'
+              f' {"mean":>6} {"std":>6} {"p10":>6} {"p50":>6} {"p90":>6} {"churn":>6} {"accuracy":>8}')
+        for r in results:
+            p = r['params']
+            p10, p50, p90 = r['percentiles']
+            print(f'{p.mmr_per_game:8} {p.underdog_diff:7} {p.underdog_bonus:8} {p.underdog_bonus_max:6} '
+                  f'{p.use_boundary:5} | {r["mean"]:6.0f} {r["std"]:6.0f} {p10:6.0f} {p50:6.0f} {p90:6.0f} '
+                  f'{r["churn"]:6.1f} {r["accuracy"]:8.1%}')
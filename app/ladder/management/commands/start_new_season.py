@@ -1,15 +1,58 @@
-from app.ladder.managers import PlayerManager
-from app.ladder.models import LadderSettings, Player
+import time
+
+from app.ladder.models import LadderSettings, Player, ScoreChange
+from app.ladder.page_cache import bump_on_commit
+from app.ladder.snapshots import schedule_snapshots
 from django.db import transaction
 from django.core.management import BaseCommand
 
 
 class Command(BaseCommand):
+    # starts new season in batches, each batch in its own transaction;
+    # if interrupted, run again with --resume to init remaining players
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size',
+                            nargs='?', type=int, default=500, const=500)
+        parser.add_argument('--resume', action='store_true', default=False,
+                            help="don't start another season, init players left in current one")
+
     def handle(self, *args, **options):
-        with transaction.atomic():
-            ladder = LadderSettings.get_solo()
+        batch_size = options['batch_size']
+
+        ladder = LadderSettings.get_solo()
+        if not options['resume']:
             ladder.current_season += 1
             ladder.save()
+        season = ladder.current_season
+
+        # players that already got initial score in this season are skipped
+        started = ScoreChange.objects.filter(season=season, info='Season started')\
+            .values_list('player_id', flat=True)
+        players = Player.objects.exclude(id__in=started).order_by('id')
+
+        total = players.count()
+        print(f'Season {season}: {total} players to init.')
+
+        done = 0
+        last_id = 0
+        start = time.perf_counter()
+        while True:
+            batch = list(players.filter(id__gt=last_id).values_list('id', 'ladder_mmr')[:batch_size])
+            if not batch:
+                break
+
+            with transaction.atomic():
+                Player.objects.init_scores(batch)
+
+            last_id = batch[-1][0]
+            done += len(batch)
+            print(f'{done}/{total} players ({time.perf_counter() - start:.1f} s)')
+
+        Player.objects.update_ranks()
+
+        # pages and snapshots cached while batches were running
+        # show the season half started, refresh them now
+        bump_on_commit('settings', 'ladder')
+        schedule_snapshots()
 
-            for player in Player.objects.all():
-                PlayerManager.init_score(player)
+        print(f'Season {season} started.')
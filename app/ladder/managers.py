@@ -1,16 +1,32 @@
 from collections import defaultdict
 import datetime
+import itertools
+import os
+import socket
+import time
+import traceback
 
 import pytz
 from django.db import models, transaction
+from django.db.models import Case, When, Value, F, Sum, Count, Avg, Max, Q
+from django.dispatch import Signal
 from django.utils import timezone
 
+from app.ladder.ranks import ladder_ranks, ranks_changed
+
+
+# sent after ranks are updated for recently recorded matches;
+# a good place to invalidate caches that depend on ladder state
+ladder_updated = Signal()
+
 
 class PlayerManager(models.Manager):
+    initial_score = 25
+
     # gives player initial score and mmr
     @staticmethod
     def init_score(player, reset_mmr=False):
-        from app.ladder.models import ScoreChange
+        from app.ladder.models import Player, ScoreChange
         from app.ladder.models import LadderSettings
 
         if reset_mmr:
@@ -19,9 +35,13 @@ class PlayerManager(models.Manager):
             # take mmr from last season
             initial_mmr = player.ladder_mmr
 
+        # totals of a new season start from zero,
+        # ScoreChange below is applied to them by score_change signal
+        Player.objects.filter(id=player.id).update(ladder_mmr=0, score=0)
+
         ScoreChange.objects.create(
             player=player,
-            score_change=25,
+            score_change=PlayerManager.initial_score,
             mmr_change=initial_mmr,
             info='Season started',
             season=LadderSettings.get_solo().current_season,
@@ -31,30 +51,231 @@ class PlayerManager(models.Manager):
         player.max_allowed_mmr = initial_mmr + 1000
         player.save()
 
+    def init_scores(self, players):
+        """
+        Same as init_score() with mmr from last season, but for many players
+        at once: ScoreChanges are bulk created and totals and mmr boundaries
+        are saved with a single UPDATE.
+
+        New season is started in batches, so matches of the new season
+        can be recorded before some of their players are initialized.
+        Changes of these matches are added to the initial totals, and last season
+        mmr of these players is summed from their last season ScoreChanges.
+
+        :param players: list of (player_id, ladder_mmr)
+        """
+        from app.ladder.models import ScoreChange
+        from app.ladder.models import LadderSettings
+
+        season = LadderSettings.get_solo().current_season
+        player_ids = [player_id for player_id, _ in players]
+
+        def season_sums(season):
+            sums = ScoreChange.objects.filter(season=season, player_id__in=player_ids)\
+                .values('player').annotate(Sum('mmr_change'), Sum('score_change'))
+            return {s['player']: (s['mmr_change__sum'], s['score_change__sum']) for s in sums}
+
+        with transaction.atomic():
+            # match recorded at the same time updates these players after this batch
+            list(self.select_for_update().filter(id__in=player_ids).values_list('id'))
+
+            recorded = season_sums(season)
+            if recorded:
+                last_season = season_sums(season - 1)
+                players = [
+                    (player_id, max(last_season[player_id][0], 0) if player_id in last_season else
+                     max(mmr - recorded[player_id][0], 0))
+                    if player_id in recorded else (player_id, mmr)
+                    for player_id, mmr in players
+                ]
+
+            # bulk_create doesn't send score_change signal, totals are set below
+            ScoreChange.objects.bulk_create([
+                ScoreChange(
+                    player_id=player_id,
+                    score_change=PlayerManager.initial_score,
+                    mmr_change=initial_mmr,
+                    info='Season started',
+                    season=season,
+                )
+                for player_id, initial_mmr in players
+            ])
+
+            def value(values, output_field):
+                return Case(
+                    *[When(id=player_id, then=Value(v)) for player_id, v in values],
+                    output_field=output_field
+                )
+
+            totals = [
+                (player_id, max(mmr + recorded.get(player_id, (0, 0))[0], 0),
+                 max(PlayerManager.initial_score + recorded.get(player_id, (0, 0))[1], 0))
+                for player_id, mmr in players
+            ]
+
+            self.filter(id__in=player_ids).update(
+                ladder_mmr=value([(t[0], t[1]) for t in totals], models.PositiveIntegerField()),
+                score=value([(t[0], t[2]) for t in totals], models.PositiveIntegerField()),
+                min_allowed_mmr=value([(player_id, mmr - 1000) for player_id, mmr in players],
+                                      models.BigIntegerField()),
+                max_allowed_mmr=value([(player_id, mmr + 1000) for player_id, mmr in players],
+                                      models.BigIntegerField()),
+            )
+
+    def apply_score_changes(self, changes, sign=1):
+        """
+        Adds ScoreChanges to players' ladder_mmr and score
+        (or subtracts them with sign=-1) with a single UPDATE.
+        Must be called after changes are saved (or deleted).
+
+        Totals are the season sum clamped at zero, same as in Player.save().
+        A total at zero can hide a negative sum, so totals of these players
+        are summed again instead of adding changes to them.
+        """
+        deltas = defaultdict(lambda: {'ladder_mmr': 0, 'score': 0})
+        for change in changes:
+            deltas[change.player_id]['ladder_mmr'] += sign * change.mmr_change
+            deltas[change.player_id]['score'] += sign * change.score_change
+
+        with transaction.atomic():
+            at_zero = list(
+                self.select_for_update().filter(id__in=list(deltas))
+                .filter(Q(ladder_mmr=0) | Q(score=0))
+                .values_list('id', flat=True)
+            )
+            if at_zero:
+                self.set_totals(self.season_totals(at_zero))
+            for player_id in at_zero:
+                del deltas[player_id]
+
+            def add(field):
+                whens = []
+                for player_id, delta in deltas.items():
+                    delta = delta[field]
+                    if delta < 0:
+                        # total is the sum here, so this is the sum clamped at zero
+                        whens.append(When(id=player_id, then=Value(0), **{f'{field}__lt': -delta}))
+                    whens.append(When(id=player_id, then=F(field) + delta))
+
+                return Case(*whens, output_field=models.PositiveIntegerField())
+
+            if deltas:
+                self.filter(id__in=list(deltas)).update(ladder_mmr=add('ladder_mmr'), score=add('score'))
+
+    @staticmethod
+    def season_totals(player_ids=None):
+        """
+        Sums ScoreChanges of current season.
+        :return: {player_id: (ladder_mmr, score)} for players that have ScoreChanges
+        """
+        from app.ladder.models import LadderSettings, ScoreChange
+
+        season = LadderSettings.get_solo().current_season
+        changes = ScoreChange.objects.filter(season=season)
+        if player_ids is not None:
+            changes = changes.filter(player_id__in=player_ids)
+
+        sums = changes.values('player').annotate(Sum('mmr_change'), Sum('score_change'))
+        return {
+            s['player']: (max(s['mmr_change__sum'], 0), max(s['score_change__sum'], 0))
+            for s in sums
+        }
+
+    def set_totals(self, totals):
+        """
+        Saves ladder_mmr and score of many players with a single UPDATE.
+        :param totals: {player_id: (ladder_mmr, score)}
+        """
+        if not totals:
+            return
+
+        def value(i):
+            return Case(
+                *[When(id=player_id, then=Value(t[i])) for player_id, t in batch],
+                output_field=models.PositiveIntegerField()
+            )
+
+        totals = list(totals.items())
+        for i in range(0, len(totals), self.ranks_batch_size):
+            batch = totals[i:i + self.ranks_batch_size]
+            self.filter(id__in=[player_id for player_id, _ in batch]).update(ladder_mmr=value(0), score=value(1))
+
+    def reconcile_scores(self, fix=True, expected=None):
+        """
+        Checks ladder_mmr and score of players against the sum of their
+        ScoreChanges in current season and repairs totals that drifted.
+
+        :param expected: current season totals if they are known already
+                         (e.g. replayed from ScoreChange log), see season_totals()
+        :return: list of (player_id, (ladder_mmr, score), (expected ladder_mmr, expected score))
+        """
+        if expected is None:
+            expected = self.season_totals()
+
+        players = self.filter(id__in=list(expected)).order_by('id').values_list('id', 'ladder_mmr', 'score')
+        drift = [
+            (player_id, (ladder_mmr, score), expected[player_id])
+            for player_id, ladder_mmr, score in players.iterator()
+            if (ladder_mmr, score) != expected[player_id]
+        ]
+
+        if fix and drift:
+            with transaction.atomic():
+                self.set_totals({player_id: totals for player_id, _, totals in drift})
+                self.update_ranks()
+
+        return drift
+
+    # rows changed by one UPDATE statement in update_ranks()
+    ranks_batch_size = 500
+
     def update_ranks(self):
         from app.ladder.models import LadderSettings
 
-        # recalculate player rankings by particular field (ladder_mmr or score)
-        def update_ranks_by(field):
-            players.sort(key=lambda p: getattr(p, field), reverse=True)
+        # recalculate player rankings by particular field (ladder_mmr or score);
+        # equal values share a rank, next rank skips them (1, 1, 3)
+        def calc_ranks(field):
+            players.sort(key=lambda p: p[field], reverse=True)
 
             ranks = [1]
             for i in range(1, len(players)):
-                curr_val = getattr(players[i], field)
-                prev_val = getattr(players[i-1], field)
+                curr_val = players[i][field]
+                prev_val = players[i-1][field]
                 ranks.append(ranks[i-1] if curr_val == prev_val else i+1)
 
-            for i, player in enumerate(players):
-                setattr(player, f'rank_{field}', ranks[i])
-                player.save()
+            return {p['id']: rank for p, rank in zip(players, ranks)}
 
         season = LadderSettings.get_solo().current_season
         players = self.filter(matchplayer__match__season=season).distinct()
-        players = players or self.all()
-        players = list(players)  # evaluate
+        if not players.exists():
+            players = self.all()
+        players = list(players.values('id', 'ladder_mmr', 'score', 'rank_ladder_mmr', 'rank_score'))
+
+        ranks = {
+            'rank_ladder_mmr': calc_ranks('ladder_mmr'),
+            'rank_score': calc_ranks('score'),
+        }
+
+        # write only changed ranks, many rows per UPDATE;
+        # player.save() is not needed for ranks
+        changed = [
+            p['id'] for p in players
+            if any(p[field] != ranks[field][p['id']] for field in ranks)
+        ]
+        with transaction.atomic():
+            for i in range(0, len(changed), self.ranks_batch_size):
+                batch = changed[i:i + self.ranks_batch_size]
+                self.filter(id__in=batch).update(**{
+                    field: Case(
+                        *[When(id=player_id, then=Value(ranks[field][player_id])) for player_id in batch],
+                        output_field=models.PositiveIntegerField()
+                    )
+                    for field in ranks
+                })
 
-        update_ranks_by('ladder_mmr')
-        update_ranks_by('score')
+        # saved ranks changed, rank indexes of all processes reload them on next use
+        ladder_ranks.clear()
+        ranks_changed()
 
     @staticmethod
     def dota_to_ladder_mmr(mmr):
@@ -67,30 +288,35 @@ class PlayerManager(models.Manager):
 
 class MatchManager(models.Manager):
     underdog_diff = 150
+    underdog_bonus = 15  # mmr points for each underdog_diff of team mmr diff
+    underdog_bonus_max = 15
 
     @staticmethod
-    def add_scores(match):
-        from app.ladder.models import ScoreChange
+    def add_scores(match, save_ranks=True):
+        from app.ladder.models import Player, ScoreChange
         from app.ladder.models import LadderSettings
 
+        ladder = LadderSettings.get_solo()
+
         # TODO: make values like win/loss change and underdog bonus changeble in admin panel
         mmr_diff = match.balance.teams[0]['mmr'] - match.balance.teams[1]['mmr']
         underdog = 0 if mmr_diff <= 0 else 1
-        underdog_bonus = abs(mmr_diff) // MatchManager.underdog_diff * 15  # 15 mmr points for each 200 mmr diff
-        underdog_bonus = min(15, underdog_bonus)  # but no more than 15 mmr
+        underdog_bonus = abs(mmr_diff) // MatchManager.underdog_diff * MatchManager.underdog_bonus
+        underdog_bonus = min(MatchManager.underdog_bonus_max, underdog_bonus)
 
         print('mmr diff: %d' % mmr_diff)
         print('underdog: %d' % underdog)
         print('underdog bonus: %d' % underdog_bonus)
         print('')
 
-        for matchPlayer in match.matchplayer_set.all():
+        changes = []
+        for matchPlayer in match.matchplayer_set.select_related('player'):
             is_victory = 1 if matchPlayer.team == match.winner else -1
             is_underdog = 1 if matchPlayer.team == underdog else -1
 
             score_change = 1 * is_victory
 
-            mmr_per_game = LadderSettings.get_solo().mmr_per_game
+            mmr_per_game = ladder.mmr_per_game
             mmr_change = mmr_per_game * is_victory
             mmr_change += underdog_bonus * is_underdog
 
@@ -102,21 +328,38 @@ class MatchManager(models.Manager):
                 new_mmr = max(player.min_allowed_mmr, min(new_mmr, player.max_allowed_mmr))
                 mmr_change = new_mmr - player.ladder_mmr
 
-            ScoreChange.objects.create(
+            changes.append(ScoreChange(
                 player=matchPlayer.player,
                 score_change=score_change,
                 mmr_change=mmr_change,
                 match=matchPlayer,
-                season=LadderSettings.get_solo().current_season,
-            )
+                season=ladder.current_season,
+            ))
+
+        # bulk_create doesn't send score_change signal,
+        # so players' totals are updated here, all in one statement
+        ScoreChange.objects.bulk_create(changes)
+        if ladder.incremental_scores:
+            Player.objects.apply_score_changes(changes)
+        else:
+            player_ids = [change.player_id for change in changes]
+            Player.objects.set_totals(Player.objects.season_totals(player_ids))
+
+        # only players whose rank shifted are saved
+        if save_ranks:
+            ladder_ranks.save_ranks(ladder.current_season)
 
     @staticmethod
-    def record_balance(answer, winner, dota_id=None):
-        from app.ladder.models import Player, Match, MatchPlayer
+    def record_balance(answer, winner, dota_id=None, save_ranks=True):
+        """
+        :param save_ranks: False if ranks are updated later
+                           (e.g. once for several matches, see JobManager)
+        """
+        from app.ladder.models import Player, Match, MatchPlayer, PlayerSeasonStats, PlayerPairStats
         from app.ladder.models import LadderSettings
 
         players = [p[0] for t in answer.teams for p in t['players']]
-        players = Player.objects.filter(name__in=players)
+        players = {p.name: p for p in Player.objects.filter(name__in=players)}
 
         # check that all players from balance exist
         # (we don't allow CustomBalance results here)
@@ -131,18 +374,19 @@ class MatchManager(models.Manager):
                 dota_id=dota_id,
             )
 
-            for i, team in enumerate(answer.teams):
-                for player in team['players']:
-                    player = next(p for p in players if p.name == player[0])
-
-                    MatchPlayer.objects.create(
-                        match=match,
-                        player=player,
-                        team=i
-                    )
+            MatchPlayer.objects.bulk_create([
+                MatchPlayer(
+                    match=match,
+                    player=players[player[0]],
+                    team=i
+                )
+                for i, team in enumerate(answer.teams)
+                for player in team['players']
+            ])
 
-            MatchManager.add_scores(match)
-            Player.objects.update_ranks()
+            MatchManager.add_scores(match, save_ranks)
+            PlayerSeasonStats.objects.add_match(match)
+            PlayerPairStats.objects.add_match(match)
 
         return match
 
@@ -151,6 +395,424 @@ class ScoreChangeManager(models.Manager):
     pass
 
 
+class PlayerSeasonStatsManager(models.Manager):
+    batch_size = 500
+
+    @staticmethod
+    def add_result(stats, won, date):
+        """
+        Adds one match result to stats, matches must be added in date order.
+        """
+        stats.matches += 1
+        if won:
+            stats.wins += 1
+            stats.streak = max(stats.streak, 0) + 1
+            stats.best_streak = max(stats.best_streak, stats.streak)
+        else:
+            stats.losses += 1
+            stats.streak = min(stats.streak, 0) - 1
+            stats.worst_streak = max(stats.worst_streak, -stats.streak)
+        stats.last_played = date
+
+    def add_match(self, match):
+        """
+        Adds just recorded match to its players' stats.
+        Existing rows are updated with a single UPDATE, missing ones
+        are created with a single INSERT.
+        """
+        from app.ladder.models import PlayerSeasonStats
+
+        results = {
+            player_id: team == match.winner
+            for player_id, team in match.matchplayer_set.values_list('player_id', 'team')
+        }
+
+        with transaction.atomic():
+            stats = self.select_for_update().filter(season=match.season, player_id__in=results)
+            stats = {s.player_id: s for s in stats}
+
+            new = []
+            for player_id, won in results.items():
+                if player_id in stats:
+                    s = stats[player_id]
+                else:
+                    s = PlayerSeasonStats(player_id=player_id, season=match.season)
+                    new.append(s)
+
+                PlayerSeasonStatsManager.add_result(s, won, match.date)
+
+            # rows are locked, so new values can be set as they are
+            def value(field, output_field):
+                return Case(
+                    *[When(id=s.id, then=Value(getattr(s, field), output_field=output_field))
+                      for s in stats.values()],
+                    output_field=output_field
+                )
+
+            if stats:
+                self.filter(id__in=[s.id for s in stats.values()]).update(
+                    matches=value('matches', models.PositiveIntegerField()),
+                    wins=value('wins', models.PositiveIntegerField()),
+                    losses=value('losses', models.PositiveIntegerField()),
+                    streak=value('streak', models.SmallIntegerField()),
+                    best_streak=value('best_streak', models.PositiveSmallIntegerField()),
+                    worst_streak=value('worst_streak', models.PositiveSmallIntegerField()),
+                    last_played=value('last_played', models.DateTimeField()),
+                )
+
+            self.bulk_create(new)
+
+    def rebuild(self, season, player_ids=None):
+        """
+        Computes stats of a season again from recorded matches,
+        for all players or only for given ones (e.g. after a match was deleted).
+        :return: number of players with stats
+        """
+        from app.ladder.models import MatchPlayer, PlayerSeasonStats
+
+        match_players = MatchPlayer.objects.filter(match__season=season)
+        if player_ids is not None:
+            match_players = match_players.filter(player_id__in=player_ids)
+
+        results = match_players.order_by('match__date', 'match_id')\
+            .values_list('player_id', 'team', 'match__winner', 'match__date')
+
+        stats = {}
+        for player_id, team, winner, date in results.iterator():
+            if player_id not in stats:
+                stats[player_id] = PlayerSeasonStats(player_id=player_id, season=season)
+            PlayerSeasonStatsManager.add_result(stats[player_id], team == winner, date)
+
+        with transaction.atomic():
+            old = self.filter(season=season)
+            if player_ids is not None:
+                old = old.filter(player_id__in=player_ids)
+            old.delete()
+
+            self.bulk_create(stats.values(), batch_size=PlayerSeasonStatsManager.batch_size)
+
+        return len(stats)
+
+
+class PlayerPairStatsManager(models.Manager):
+    batch_size = 1000
+
+    @staticmethod
+    def pairs(match_players, winner):
+        """
+        Pairs of players of one match, from the point of view of each player.
+
+        :param match_players: list of (player_id, team, mmr_change, score_change)
+        :return: list of ((player_id, other_id, same_team), (wins, mmr_change, score_change))
+        """
+        return [
+            ((player_id, other_id, team == other_team), (int(team == winner), mmr_change or 0, score_change or 0))
+            for player_id, team, mmr_change, score_change in match_players
+            for other_id, other_team, _, _ in match_players
+            if other_id != player_id
+        ]
+
+    @staticmethod
+    def match_players(match):
+        return list(match.matchplayer_set.values_list(
+            'player_id', 'team', 'scorechange__mmr_change', 'scorechange__score_change'))
+
+    def update_pairs(self, pairs, sign, date=None):
+        """
+        Adds (sign=1) or subtracts (sign=-1) match results from existing pairs.
+        Results of a player are the same for all teammates (or opponents),
+        so it's one UPDATE per player and side.
+        """
+        groups = defaultdict(list)
+        for (player_id, other_id, same_team), values in pairs:
+            groups[(player_id, same_team, values)].append(other_id)
+
+        for (player_id, same_team, (wins, mmr_change, score_change)), others in groups.items():
+            values = {
+                'matches': F('matches') + sign,
+                'wins': F('wins') + sign * wins,
+                'mmr_change': F('mmr_change') + sign * mmr_change,
+                'score_change': F('score_change') + sign * score_change,
+            }
+            if date:
+                values['last_played'] = date
+
+            self.filter(player_id=player_id, same_team=same_team, other_id__in=others).update(**values)
+
+    def add_match(self, match):
+        """
+        Adds just recorded match to pairs of its players.
+        Must be called after match's ScoreChanges are created.
+        """
+        from app.ladder.models import PlayerPairStats
+
+        pairs = PlayerPairStatsManager.pairs(PlayerPairStatsManager.match_players(match), match.winner)
+        player_ids = set(key[0] for key, _ in pairs)
+
+        with transaction.atomic():
+            existing = set(
+                self.select_for_update().filter(player_id__in=player_ids, other_id__in=player_ids)
+                .values_list('player_id', 'other_id', 'same_team')
+            )
+
+            self.update_pairs([p for p in pairs if p[0] in existing], 1, match.date)
+            self.bulk_create([
+                PlayerPairStats(
+                    player_id=player_id, other_id=other_id, same_team=same_team,
+                    matches=1, wins=wins, mmr_change=mmr_change, score_change=score_change,
+                    last_played=match.date,
+                )
+                for (player_id, other_id, same_team), (wins, mmr_change, score_change) in pairs
+                if (player_id, other_id, same_team) not in existing
+            ])
+
+    def remove_match(self, match_players, winner):
+        """
+        Subtracts deleted match from pairs of its players.
+        Last played dates of these pairs are found again from remaining matches.
+
+        :param match_players: match_players() of the match before it was deleted
+        """
+        from app.ladder.models import MatchPlayer
+
+        pairs = PlayerPairStatsManager.pairs(match_players, winner)
+        player_ids = set(key[0] for key, _ in pairs)
+
+        with transaction.atomic():
+            self.update_pairs(pairs, -1)
+            self.filter(player_id__in=player_ids, matches=0).delete()
+
+            keys = set(key for key, _ in pairs)
+            last_played = MatchPlayer.objects\
+                .filter(player_id__in=player_ids, match__matchplayer__player_id__in=player_ids)\
+                .order_by()\
+                .values_list('player_id', 'match__matchplayer__player_id', 'team', 'match__matchplayer__team')\
+                .annotate(Max('match__date'))
+
+            # (0, 0) and (1, 1) teams are the same pair, so are (0, 1) and (1, 0)
+            dates = {}
+            for player_id, other_id, team, other_team, date in last_played:
+                key = (player_id, other_id, team == other_team)
+                if key in keys:
+                    dates[key] = max(dates.get(key, date), date)
+
+            groups = defaultdict(list)
+            for (player_id, other_id, same_team), date in dates.items():
+                groups[(player_id, same_team, date)].append(other_id)
+
+            for (player_id, same_team, date), others in groups.items():
+                self.filter(player_id=player_id, same_team=same_team, other_id__in=others).update(last_played=date)
+
+    def rebuild(self, player_ids=None):
+        """
+        Computes pairs again from recorded matches,
+        all of them or only pairs with given players (e.g. after a match was edited).
+        :return: number of pairs
+        """
+        from app.ladder.models import MatchPlayer, PlayerPairStats
+
+        results = MatchPlayer.objects.all()
+        if player_ids is not None:
+            player_ids = set(player_ids)
+            results = results.filter(match__matchplayer__player_id__in=player_ids).distinct()
+
+        results = results.order_by('match_id').values_list(
+            'match_id', 'match__winner', 'match__date',
+            'player_id', 'team', 'scorechange__mmr_change', 'scorechange__score_change')
+
+        stats = {}
+
+        def add(match_players, winner, date):
+            for key, (wins, mmr_change, score_change) in PlayerPairStatsManager.pairs(match_players, winner):
+                if key not in stats:
+                    stats[key] = PlayerPairStats(
+                        player_id=key[0], other_id=key[1], same_team=key[2],
+                        matches=0, wins=0, mmr_change=0, score_change=0)
+                pair = stats[key]
+                pair.matches += 1
+                pair.wins += wins
+                pair.mmr_change += mmr_change
+                pair.score_change += score_change
+                pair.last_played = max(pair.last_played or date, date)
+
+        # rows are grouped by match, results are folded match by match
+        for (match_id, winner, date), rows in itertools.groupby(results.iterator(), lambda r: r[:3]):
+            add([r[3:] for r in rows], winner, date)
+
+        old = self.all()
+        if player_ids is not None:
+            # matches of these players also pair up other players, those pairs are left as they are
+            stats = {key: pair for key, pair in stats.items() if key[0] in player_ids or key[1] in player_ids}
+            old = old.filter(Q(player_id__in=player_ids) | Q(other_id__in=player_ids))
+
+        with transaction.atomic():
+            old.delete()
+            self.bulk_create(stats.values(), batch_size=PlayerPairStatsManager.batch_size)
+
+        return len(stats)
+
+
+class JobManager(models.Manager):
+    # matches recorded within this time share one ranks update
+    coalesce_window = datetime.timedelta(seconds=30)
+
+    max_attempts = 5
+    retry_delay = datetime.timedelta(seconds=30)  # doubles after each failed attempt
+
+    # job taken by a runner longer ago than this is considered lost (runner died)
+    lease_timeout = datetime.timedelta(minutes=10)
+
+    @staticmethod
+    def runner_id():
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def enqueue(self, kind, payload=None, delay=None, coalesce=False):
+        """
+        Adds a job to run after `delay`.
+        With `coalesce` a job of the same kind that is still pending is returned instead.
+        """
+        from app.ladder.models import Job
+
+        if coalesce:
+            job = self.filter(kind=kind, status=Job.PENDING).first()
+            if job:
+                return job
+
+        return self.create(
+            kind=kind,
+            payload=payload,
+            run_after=timezone.now() + (delay or datetime.timedelta()),
+        )
+
+    def record_match(self, answer, winner, dota_id=None):
+        from app.ladder.models import Job
+
+        return self.enqueue(Job.RECORD_MATCH, {
+            'answer': answer.id,
+            'winner': winner,
+            'dota_id': dota_id,
+        })
+
+    def recover(self):
+        """
+        Returns jobs whose lease expired (their runner stopped) to the queue.
+        Job's work and its status are saved in one transaction,
+        so these jobs didn't change anything.
+        Jobs of runners that are still working are left alone.
+        """
+        from app.ladder.models import Job
+
+        expired = timezone.now() - JobManager.lease_timeout
+        self.filter(status=Job.RUNNING)\
+            .filter(Q(started__lt=expired) | Q(started__isnull=True))\
+            .update(status=Job.PENDING, locked_by='', started=None)
+
+    def run_pending(self, runner=None):
+        """
+        Runs due jobs in order they were added.
+        :return: number of jobs run
+        """
+        from app.ladder.models import Job
+
+        runner = runner or JobManager.runner_id()
+
+        jobs = self.filter(status=Job.PENDING, run_after__lte=timezone.now()).order_by('id')
+        count = 0
+        for job in jobs:
+            # make sure no other runner took it
+            if self.filter(id=job.id, status=Job.PENDING)\
+                    .update(status=Job.RUNNING, locked_by=runner, started=timezone.now()):
+                self.run(job, runner)
+                count += 1
+
+        return count
+
+    def run(self, job, runner):
+        from app.ladder.models import Job
+
+        handlers = {
+            Job.RECORD_MATCH: JobManager.do_record_match,
+            Job.UPDATE_RANKS: JobManager.do_update_ranks,
+            Job.RENDER_SNAPSHOTS: JobManager.do_render_snapshots,
+            Job.RECONCILE_SCORES: JobManager.do_reconcile_scores,
+        }
+
+        job.attempts += 1
+        job.locked_by = ''
+        job.started = None
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                # row stays locked until the job is done, so recover() in another runner
+                # waits for it instead of returning the job to the queue
+                if not self.select_for_update().filter(id=job.id, status=Job.RUNNING, locked_by=runner).exists():
+                    print(f'Job {job} was taken over by another runner')
+                    return
+
+                handlers[job.kind](job.payload)
+
+                job.status = Job.DONE
+                job.error = ''
+                job.finished = timezone.now()
+                job.duration = time.perf_counter() - start
+                job.save()
+        except Exception:
+            job.error = traceback.format_exc()
+            job.duration = time.perf_counter() - start
+            if job.attempts >= JobManager.max_attempts:
+                job.status = Job.FAILED
+            else:
+                job.status = Job.PENDING
+                job.run_after = timezone.now() + JobManager.retry_delay * 2 ** (job.attempts - 1)
+            job.save()
+
+            print(f'Job {job} failed (attempt {job.attempts}):\n{job.error}')
+
+    def stats(self):
+        """
+        :return: number of jobs and timings by kind and status
+        """
+        return list(
+            self.values('kind', 'status')
+            .annotate(count=Count('id'), avg_duration=Avg('duration'), max_duration=Max('duration'))
+            .order_by('kind', 'status')
+        )
+
+    @staticmethod
+    def do_record_match(payload):
+        from app.balancer.models import BalanceAnswer
+        from app.ladder.models import Job
+
+        answer = BalanceAnswer.objects.get(id=payload['answer'])
+        match = MatchManager.record_balance(answer, payload['winner'], payload['dota_id'], save_ranks=False)
+        if not match:
+            print(f'Balance {answer.id} has unknown players, match not recorded')
+            return
+
+        # ranks are updated once for all matches recorded within the window
+        Job.objects.enqueue(Job.UPDATE_RANKS, delay=JobManager.coalesce_window, coalesce=True)
+
+    @staticmethod
+    def do_update_ranks(payload):
+        from app.ladder.models import LadderSettings
+
+        ladder_ranks.save_ranks(LadderSettings.get_solo().current_season)
+        ladder_updated.send(sender=JobManager)
+
+    @staticmethod
+    def do_render_snapshots(payload):
+        from app.ladder.snapshots import render_snapshots
+
+        render_snapshots()
+
+    @staticmethod
+    def do_reconcile_scores(payload):
+        from app.ladder.models import Player
+
+        drift = Player.objects.reconcile_scores()
+        print(f'Reconciled scores, {len(drift)} players repaired.')
+
+
 class QueueChannelManager(models.Manager):
     @staticmethod
     def activate_qchannels():
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 10:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ladder', '0084_auto_20240403_0747'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='laddersettings',
+            name='balance_engine',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Python'), (1, 'NumPy')], default=0),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ladder', '0085_laddersettings_balance_engine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='laddersettings',
+            name='balance_policy',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'All answers, roles first'), (1, 'Pareto front, roles first'), (2, 'Pareto front, MMR first')], default=0),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 13:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ladder', '0086_laddersettings_balance_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='laddersettings',
+            name='incremental_scores',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 14:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ladder', '0087_laddersettings_incremental_scores'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='laddersettings',
+            name='balance_exponent',
+            field=models.FloatField(default=3),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 16:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_season_stats(apps, schema_editor):
+    MatchPlayer = apps.get_model('ladder', 'MatchPlayer')
+    PlayerSeasonStats = apps.get_model('ladder', 'PlayerSeasonStats')
+
+    results = MatchPlayer.objects.order_by('match__date', 'match_id')\
+        .values_list('player_id', 'match__season', 'team', 'match__winner', 'match__date')
+
+    stats = {}
+    for player_id, season, team, winner, date in results.iterator():
+        s = stats.get((player_id, season))
+        if s is None:
+            s = stats[(player_id, season)] = PlayerSeasonStats(
+                player_id=player_id, season=season,
+                matches=0, wins=0, losses=0, streak=0, best_streak=0, worst_streak=0)
+
+        s.matches += 1
+        if team == winner:
+            s.wins += 1
+            s.streak = max(s.streak, 0) + 1
+            s.best_streak = max(s.best_streak, s.streak)
+        else:
+            s.losses += 1
+            s.streak = min(s.streak, 0) - 1
+            s.worst_streak = max(s.worst_streak, -s.streak)
+        s.last_played = date
+
+    PlayerSeasonStats.objects.bulk_create(stats.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ladder', '0089_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerSeasonStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('season', models.PositiveSmallIntegerField()),
+                ('matches', models.PositiveIntegerField(default=0)),
+                ('wins', models.PositiveIntegerField(default=0)),
+                ('losses', models.PositiveIntegerField(default=0)),
+                ('streak', models.SmallIntegerField(default=0)),
+                ('best_streak', models.PositiveSmallIntegerField(default=0)),
+                ('worst_streak', models.PositiveSmallIntegerField(default=0)),
+                ('last_played', models.DateTimeField(blank=True, null=True)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ladder.Player')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='playerseasonstats',
+            unique_together=set([('player', 'season')]),
+        ),
+        migrations.RunPython(fill_season_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 17:00
+from __future__ import unicode_literals
+
+import itertools
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_pair_stats(apps, schema_editor):
+    MatchPlayer = apps.get_model('ladder', 'MatchPlayer')
+    PlayerPairStats = apps.get_model('ladder', 'PlayerPairStats')
+
+    results = MatchPlayer.objects.order_by('match_id').values_list(
+        'match_id', 'match__winner', 'match__date',
+        'player_id', 'team', 'scorechange__mmr_change', 'scorechange__score_change')
+
+    stats = {}
+    for (match_id, winner, date), rows in itertools.groupby(results.iterator(), lambda r: r[:3]):
+        match_players = [r[3:] for r in rows]
+        for player_id, team, mmr_change, score_change in match_players:
+            for other_id, other_team, _, _ in match_players:
+                if other_id == player_id:
+                    continue
+
+                key = (player_id, other_id, team == other_team)
+                pair = stats.get(key)
+                if pair is None:
+                    pair = stats[key] = PlayerPairStats(
+                        player_id=player_id, other_id=other_id, same_team=key[2],
+                        matches=0, wins=0, mmr_change=0, score_change=0)
+
+                pair.matches += 1
+                pair.wins += team == winner
+                pair.mmr_change += mmr_change or 0
+                pair.score_change += score_change or 0
+                pair.last_played = max(pair.last_played or date, date)
+
+    PlayerPairStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ladder', '0090_playerseasonstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerPairStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('same_team', models.BooleanField()),
+                ('matches', models.PositiveIntegerField(default=0)),
+                ('wins', models.PositiveIntegerField(default=0)),
+                ('mmr_change', models.IntegerField(default=0)),
+                ('score_change', models.IntegerField(default=0)),
+                ('last_played', models.DateTimeField(blank=True, null=True)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ladder.Player')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ladder.Player')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='playerpairstats',
+            unique_together=set([('player', 'other', 'same_team')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='playerpairstats',
+            index_together=set([('player', 'same_team', 'mmr_change')]),
+        ),
+        migrations.RunPython(fill_pair_stats, migrations.RunPython.noop),
+    ]
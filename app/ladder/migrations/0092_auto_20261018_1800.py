@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 18:00
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ladder', '0091_playerpairstats'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='match',
+            index_together=set([('season', 'id')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 20:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ladder', '0093_auto_20261018_1900'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='locked_by',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 21:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ladder', '0094_auto_20261018_2000'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('record_match', 'Record match'), ('update_ranks', 'Update ranks'), ('render_snapshots', 'Render snapshots'), ('reconcile_scores', 'Reconcile scores')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 22:00
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ladder', '0095_auto_20261018_2100'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='scorechange',
+            index_together=set([('season', 'id')]),
+        ),
+    ]
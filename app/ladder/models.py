@@ -5,9 +5,11 @@ from multiselectfield import MultiSelectField
 
 from app.balancer.models import BalanceAnswer
 from autoslug import AutoSlugField
-from app.ladder.managers import PlayerManager, ScoreChangeManager
+from app.ladder.managers import PlayerManager, ScoreChangeManager, JobManager, PlayerSeasonStatsManager, \
+    PlayerPairStatsManager
 from solo.models import SingletonModel
 from annoying.fields import AutoOneToOneField
+from jsonfield import JSONField
 
 
 def create_roles_pref():
@@ -107,6 +109,10 @@ class Match(models.Model):
     season = models.PositiveSmallIntegerField(default=1)
     dota_id = models.CharField(max_length=255, null=True)
 
+    class Meta:
+        # match history is paged by id within a season
+        index_together = ('season', 'id')
+
 
 class MatchPlayer(models.Model):
     match = models.ForeignKey(Match)
@@ -135,13 +141,56 @@ class ScoreChange(models.Model):
     class Meta:
         unique_together = ('player', 'match')
         ordering = ('-id', )
+        # log of one season is replayed by id, see replay.py
+        index_together = ('season', 'id')
+
+
+# read model of player's results in a season, used by leaderboards;
+# updated when a match is recorded or deleted, see PlayerSeasonStatsManager
+class PlayerSeasonStats(models.Model):
+    player = models.ForeignKey(Player)
+    season = models.PositiveSmallIntegerField()
+
+    matches = models.PositiveIntegerField(default=0)
+    wins = models.PositiveIntegerField(default=0)
+    losses = models.PositiveIntegerField(default=0)
+
+    streak = models.SmallIntegerField(default=0)  # current, positive for wins, negative for losses
+    best_streak = models.PositiveSmallIntegerField(default=0)
+    worst_streak = models.PositiveSmallIntegerField(default=0)
+    last_played = models.DateTimeField(null=True, blank=True)
+
+    objects = PlayerSeasonStatsManager()
+
+    class Meta:
+        unique_together = ('player', 'season')
+
+
+# results of a player in matches with another player, as teammates or opponents, all seasons;
+# there are two rows for each pair, one from each player's point of view
+class PlayerPairStats(models.Model):
+    player = models.ForeignKey(Player)
+    other = models.ForeignKey(Player, related_name='+')
+    same_team = models.BooleanField()
+
+    matches = models.PositiveIntegerField(default=0)
+    wins = models.PositiveIntegerField(default=0)  # player's wins
+    mmr_change = models.IntegerField(default=0)  # player's mmr and score changes
+    score_change = models.IntegerField(default=0)
+    last_played = models.DateTimeField(null=True, blank=True)
+
+    objects = PlayerPairStatsManager()
+
+    class Meta:
+        unique_together = ('player', 'other', 'same_team')
+        index_together = ('player', 'same_team', 'mmr_change')
 
 
 class LadderSettings(SingletonModel):
     current_season = models.PositiveSmallIntegerField(default=1)
     use_queue = models.BooleanField(default=True)
     mmr_per_game = models.PositiveSmallIntegerField(default=50)
-    balance_exponent = models.PositiveSmallIntegerField(default=3)
+    balance_exponent = models.FloatField(default=3)
     afk_allowed_time = models.PositiveSmallIntegerField(default=25)
     afk_response_time = models.PositiveSmallIntegerField(default=5)
     votekick_treshold = models.PositiveSmallIntegerField(default=3)
@@ -168,6 +217,30 @@ class LadderSettings(SingletonModel):
     )
     queue_mmr_filter = models.PositiveSmallIntegerField(choices=QFILTER_CHOICES, default=LADDER_MMR)
 
+    # engine used for role balancing
+    PYTHON_ENGINE = 0
+    NUMPY_ENGINE = 1
+    ENGINE_CHOICES = (
+        (PYTHON_ENGINE, 'Python'),
+        (NUMPY_ENGINE, 'NumPy'),
+    )
+    balance_engine = models.PositiveSmallIntegerField(choices=ENGINE_CHOICES, default=PYTHON_ENGINE)
+
+    # how role balancer picks answers
+    LADDER_POLICY = 0
+    FRONT_ROLES_POLICY = 1
+    FRONT_MMR_POLICY = 2
+    POLICY_CHOICES = (
+        (LADDER_POLICY, 'All answers, roles first'),
+        (FRONT_ROLES_POLICY, 'Pareto front, roles first'),
+        (FRONT_MMR_POLICY, 'Pareto front, MMR first'),
+    )
+    balance_policy = models.PositiveSmallIntegerField(choices=POLICY_CHOICES, default=LADDER_POLICY)
+
+    # apply each ScoreChange to player totals instead of summing all of them again;
+    # totals are checked by PlayerManager.reconcile_scores()
+    incremental_scores = models.BooleanField(default=True)
+
 
 class DiscordChannels(SingletonModel):
     polls = models.BigIntegerField(null=True, blank=True)
@@ -255,4 +328,51 @@ class PlayerReport(models.Model):
         unique_together = ('from_player', 'to_player', 'match')
 
     def __str__(self):
-        return f'Report from {self.from_player.name} to {self.to_player.name} for match {self.match.id}'
\ No newline at end of file
+        return f'Report from {self.from_player.name} to {self.to_player.name} for match {self.match.id}'
+
+
+# deferred work that is done outside of bot loops, see JobManager
+class Job(models.Model):
+    RECORD_MATCH = 'record_match'
+    UPDATE_RANKS = 'update_ranks'
+    RENDER_SNAPSHOTS = 'render_snapshots'
+    RECONCILE_SCORES = 'reconcile_scores'
+    KIND_CHOICES = (
+        (RECORD_MATCH, 'Record match'),
+        (UPDATE_RANKS, 'Update ranks'),
+        (RENDER_SNAPSHOTS, 'Render snapshots'),
+        (RECONCILE_SCORES, 'Reconcile scores'),
+    )
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES)
+    payload = JSONField(null=True, blank=True)
+
+    PENDING = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = 3
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    # runner that took the job and when, see JobManager.recover()
+    locked_by = models.CharField(max_length=100, blank=True)
+    started = models.DateTimeField(null=True, blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField()
+    finished = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)  # seconds, last attempt
+
+    objects = JobManager()
+
+    class Meta:
+        index_together = ('status', 'run_after')
+
+    def __str__(self):
+        return f'{self.kind} #{self.id}'
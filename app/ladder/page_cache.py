@@ -0,0 +1,153 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+
+# Ladder pages are cached until data they show changes.
+# Data changes are tracked by versions kept in the shared cache
+# (bots record matches in other processes):
+#   - 'ladder': player lists, match history and stats;
+#   - 'player_<id>': pages of one player;
+#   - 'settings': everything, e.g. when a new season starts.
+# Versions are bumped by signals, see signals.py.
+# Same versions tell in-process rank indexes to reload ('ranks', see ranks.py).
+
+def version_key(name):
+    return f'ladder_version_{name}'
+
+
+def get_version(name):
+    """
+    :return: (version number, time of the last bump)
+    """
+    version = cache.get(version_key(name))
+    if version is None:
+        version = (0, time.time())
+        cache.add(version_key(name), version)
+    return version
+
+
+def bump_version(name):
+    number, _ = get_version(name)
+    cache.set(version_key(name), (number + 1, time.time()))
+
+
+def bump_on_commit(*names):
+    """
+    Bumps versions after current transaction is committed,
+    so pages are not cached with data that is not saved yet.
+    """
+    def bump():
+        for name in names:
+            bump_version(name)
+
+    transaction.on_commit(bump)
+
+
+def count(view, name, value=1):
+    key = f'page_cache_{view}_{name}'
+    cache.add(key, 0)
+    try:
+        cache.incr(key, value)
+    except ValueError:
+        pass  # expired in between, not worth retrying
+
+
+def page_cache_stats(views):
+    """
+    :return: {view: {hits, misses, not_modified, hit_ratio, avg_render_ms}}
+    """
+    stats = {}
+    for view in views:
+        s = {name: cache.get(f'page_cache_{view}_{name}', 0)
+             for name in ('hits', 'misses', 'not_modified', 'render_ms')}
+        served = s['hits'] + s['misses'] + s['not_modified']
+        s['hit_ratio'] = float(s['hits'] + s['not_modified']) / served if served else 0
+        s['avg_render_ms'] = float(s.pop('render_ms')) / s['misses'] if s['misses'] else 0
+        stats[view] = s
+
+    return stats
+
+
+def is_not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        return etag in parse_etags(if_none_match)
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+class CachedPageMixin:
+    """
+    Serves rendered page from cache until one of page_versions() is bumped,
+    answers conditional GETs (ETag / Last-Modified) with 304.
+
+    Only anonymous GETs are cached, pages for logged in users can differ.
+    Set max_age for pages that also change with time.
+    """
+    max_age = None  # seconds
+
+    def page_versions(self):
+        """
+        :return: names of versions this page depends on or None to skip caching
+        """
+        return ['settings', 'ladder']
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated():
+            return super(CachedPageMixin, self).dispatch(request, *args, **kwargs)
+
+        names = self.page_versions()
+        if names is None:
+            return super(CachedPageMixin, self).dispatch(request, *args, **kwargs)
+
+        versions = [get_version(name) for name in names]
+        last_modified = max(bumped for _, bumped in versions)
+        key = [request.get_full_path()] + [number for number, _ in versions]
+        if self.max_age:
+            period = int(time.time() // self.max_age)
+            last_modified = max(last_modified, period * self.max_age)
+            key.append(period)
+
+        key = hashlib.sha1(repr(key).encode()).hexdigest()
+        etag = quote_etag(key)
+        view = self.__class__.__name__
+
+        if is_not_modified(request, key, last_modified):
+            count(view, 'not_modified')
+            response = HttpResponseNotModified()
+        else:
+            page = cache.get(f'page_{key}')
+            if page is not None:
+                count(view, 'hits')
+                response = HttpResponse(page['content'], content_type=page['content_type'])
+            else:
+                start = time.perf_counter()
+                response = super(CachedPageMixin, self).dispatch(request, *args, **kwargs)
+                if hasattr(response, 'render'):
+                    response.render()
+
+                count(view, 'misses')
+                count(view, 'render_ms', int((time.perf_counter() - start) * 1000))
+
+                if response.status_code != 200:
+                    return response
+
+                # old versions of the page are never requested again,
+                # timeout lets them go
+                cache.set(f'page_{key}', {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                }, 7 * 24 * 3600)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, max_age=0, must_revalidate=True)
+
+        return response
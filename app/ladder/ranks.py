@@ -0,0 +1,263 @@
+from django.db import transaction
+from django.db.models import Count, Max
+
+from app.ladder.page_cache import get_version, bump_version, bump_on_commit
+
+
+def ranks_changed():
+    """
+    Tells rank indexes of all processes to reload: values or saved ranks
+    changed in a way sync can't see (full update_ranks(), edited ScoreChanges).
+    Bulk updates don't send signals, so cached ladder pages are outdated too.
+    """
+    bump_on_commit('ranks', 'ladder')
+
+
+class RankIndex:
+    """
+    Ranks of players by a non-negative integer value (ladder_mmr or score).
+    Counts of players per value are kept in a Fenwick tree,
+    so insert, remove and rank queries take O(log max_value).
+
+    Rank is 1 + number of players with a greater value,
+    same as in PlayerManager.update_ranks() (1, 1, 3).
+    """
+    def __init__(self):
+        self.values = {}  # player_id -> value
+        self.tree = [0] * 1025
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, player_id):
+        return player_id in self.values
+
+    def _add(self, value, delta):
+        if value + 1 >= len(self.tree):
+            self._grow(value)
+
+        i = value + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _grow(self, value):
+        size = len(self.tree) - 1
+        while size <= value + 1:
+            size *= 2
+
+        self.tree = [0] * (size + 1)
+        for v in self.values.values():
+            i = v + 1
+            while i <= size:
+                self.tree[i] += 1
+                i += i & -i
+
+    def count_up_to(self, value):
+        """
+        :return: number of players with value <= given value
+        """
+        i = min(value + 1, len(self.tree) - 1)
+        count = 0
+        while i > 0:
+            count += self.tree[i]
+            i -= i & -i
+        return count
+
+    def set(self, player_id, value):
+        self.remove(player_id)
+        self._add(value, 1)
+        self.values[player_id] = value
+
+    def remove(self, player_id):
+        value = self.values.pop(player_id, None)
+        if value is not None:
+            self._add(value, -1)
+
+    def rank_of_value(self, value):
+        return 1 + len(self.values) - self.count_up_to(value)
+
+    def rank(self, player_id):
+        return self.rank_of_value(self.values[player_id])
+
+
+class SeasonRanks:
+    """
+    Rank indexes of one season's players (players with a match in the season)
+    for ladder_mmr and score, and ranks that are saved in the database.
+    """
+    fields = ('ladder_mmr', 'score')
+
+    def __init__(self, season):
+        self.season = season
+        self.indexes = {field: RankIndex() for field in self.fields}
+        self.saved = {field: {} for field in self.fields}  # player_id -> rank in db
+
+        # last seen ScoreChange of the season, to find changes made by other processes
+        self.last_change = 0
+        self.changes_count = 0
+
+        self.version = None  # ranks version this index was loaded at, see ranks_changed()
+
+    def load(self):
+        from app.ladder.models import Player, ScoreChange
+
+        self.version, _ = get_version('ranks')
+
+        changes = ScoreChange.objects.filter(season=self.season)\
+            .aggregate(Max('id'), Count('id'))
+        self.last_change = changes['id__max'] or 0
+        self.changes_count = changes['id__count']
+
+        players = Player.objects.filter(matchplayer__match__season=self.season).distinct()
+        for p in players.values('id', 'ladder_mmr', 'score', 'rank_ladder_mmr', 'rank_score'):
+            self.set_player(p)
+
+    def set_player(self, player):
+        """
+        :param player: dict with id, ranked values and saved ranks
+        """
+        for field in self.fields:
+            self.indexes[field].set(player['id'], player[field])
+            self.saved[field][player['id']] = player[f'rank_{field}']
+
+    def remove_player(self, player_id):
+        for field in self.fields:
+            self.indexes[field].remove(player_id)
+            self.saved[field].pop(player_id, None)
+
+    def sync(self):
+        """
+        Reloads players whose ScoreChanges appeared since the last sync.
+        :return: False if some ScoreChanges were deleted and indexes need a full reload
+        """
+        from app.ladder.models import Player, ScoreChange, MatchPlayer
+
+        new_changes = ScoreChange.objects.filter(season=self.season, id__gt=self.last_change)\
+            .values_list('id', 'player_id')
+        new_changes = list(new_changes)
+        count = ScoreChange.objects.filter(season=self.season).count()
+
+        if count != self.changes_count + len(new_changes):
+            return False
+
+        if not new_changes:
+            return True
+
+        self.last_change = max(change_id for change_id, _ in new_changes)
+        self.changes_count = count
+
+        ids = set(player_id for _, player_id in new_changes)
+        in_season = set(
+            MatchPlayer.objects.filter(match__season=self.season, player_id__in=ids)
+            .values_list('player_id', flat=True)
+        )
+        players = Player.objects.filter(id__in=ids)\
+            .values('id', 'ladder_mmr', 'score', 'rank_ladder_mmr', 'rank_score')
+
+        for p in players:
+            if p['id'] in in_season:
+                self.set_player(p)
+            else:
+                self.remove_player(p['id'])
+
+        return True
+
+    def changed_ranks(self):
+        """
+        :return: {field: {player_id: rank}} for players whose saved rank is outdated
+        """
+        changed = {}
+        for field in self.fields:
+            ranks = ((player_id, self.indexes[field].rank(player_id)) for player_id in self.saved[field])
+            changed[field] = {
+                player_id: rank for player_id, rank in ranks
+                if rank != self.saved[field][player_id]
+            }
+
+        return changed
+
+
+class LadderRanks:
+    """
+    In-process rank index of current season players.
+
+    Each match changes scores of only 10 players, so instead of ranking
+    all players again, changed players are moved in rank indexes and only
+    players whose rank shifted are saved to the database.
+    Database stays the source of ranks for everything that reads them,
+    new ScoreChanges of other processes are picked up on sync,
+    other changes make indexes reload, see ranks_changed().
+    """
+    def __init__(self):
+        self.seasons = {}
+
+    def get(self, season):
+        ranks = self.seasons.get(season)
+        if ranks is None or ranks.version != get_version('ranks')[0] or not ranks.sync():
+            ranks = SeasonRanks(season)
+            ranks.load()
+            self.seasons = {season: ranks}  # older seasons don't change
+
+        return ranks
+
+    def player_changed(self, player, season):
+        """
+        Moves player in indexes after player's ladder_mmr or score changed.
+        Called from score_change signal, doesn't query the database.
+        """
+        ranks = self.seasons.get(season)
+        if ranks is None or player.id not in ranks.indexes['score']:
+            return  # not ranked yet, next sync will pick it up
+
+        for field in ranks.fields:
+            ranks.indexes[field].set(player.id, getattr(player, field))
+
+    def save_ranks(self, season):
+        """
+        Saves ranks that shifted since last save.
+        """
+        from app.ladder.models import Player
+
+        ranks = self.get(season)
+        if not len(ranks.indexes['score']):
+            # nobody played this season yet, all players are ranked
+            Player.objects.update_ranks()
+            return
+
+        changed_ranks = ranks.changed_ranks()
+        if not any(changed_ranks.values()):
+            return
+
+        with transaction.atomic():
+            for field, changed in changed_ranks.items():
+                # one UPDATE per rank value, players with equal values share it
+                by_rank = {}
+                for player_id, rank in changed.items():
+                    by_rank.setdefault(rank, []).append(player_id)
+
+                for rank, ids in by_rank.items():
+                    Player.objects.filter(id__in=ids).update(**{f'rank_{field}': rank})
+
+            transaction.on_commit(lambda: self.ranks_saved(ranks, changed_ranks))
+
+    @staticmethod
+    def ranks_saved(ranks, changed_ranks):
+        """
+        Remembers saved ranks once they are committed and tells other processes
+        their saved ranks are outdated. This index knows the new ranks already,
+        it's not reloaded unless somebody else changed ranks too.
+        """
+        for field, changed in changed_ranks.items():
+            ranks.saved[field].update(changed)
+
+        number, _ = get_version('ranks')
+        bump_version('ranks')
+        if ranks.version == number:
+            ranks.version = number + 1
+
+    def clear(self):
+        self.seasons = {}
+
+
+ladder_ranks = LadderRanks()
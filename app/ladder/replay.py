@@ -0,0 +1,68 @@
+import numpy as np
+
+
+def replay_totals(batch_size=100000, season=None):
+    """
+    Folds the whole ScoreChange log (or the log of one season)
+    into ladder_mmr and score of every player for every season.
+
+    ScoreChanges are streamed in id order in batches, so memory is bounded
+    by seasons x players, not by the size of the log.
+    Each batch is summed with np.bincount grouped by (season, player).
+
+    :param season: only ScoreChanges of this season are read, other seasons stay zero
+    :return: (mmr, score, changes) arrays indexed by [season, player_id]:
+             sums (not clamped at zero) and number of ScoreChanges
+    """
+    from app.ladder.models import ScoreChange
+
+    totals = np.zeros((3, 1, 1), dtype=np.int64)  # mmr, score, changes
+
+    changes = ScoreChange.objects.all()
+    if season is not None:
+        changes = changes.filter(season=season)
+
+    last_id = 0
+    while True:
+        batch = changes.filter(id__gt=last_id).order_by('id')\
+            .values_list('id', 'season', 'player_id', 'mmr_change', 'score_change')[:batch_size]
+        batch = np.array(list(batch), dtype=np.int64).reshape(-1, 5)
+        if not len(batch):
+            break
+
+        last_id = int(batch[-1, 0])
+        seasons, players = batch[:, 1], batch[:, 2]
+
+        # grow arrays when new seasons or players appear
+        shape = (max(totals.shape[1], seasons.max() + 1), max(totals.shape[2], players.max() + 1))
+        if shape != totals.shape[1:]:
+            totals = np.pad(totals, [(0, 0), (0, shape[0] - totals.shape[1]), (0, shape[1] - totals.shape[2])],
+                            mode='constant')
+
+        group = seasons * shape[1] + players
+        size = shape[0] * shape[1]
+        for i, weights in enumerate([batch[:, 3], batch[:, 4], None]):
+            sums = np.bincount(group, weights=weights, minlength=size)
+            totals[i] += np.rint(sums).astype(np.int64).reshape(shape)
+
+    return totals[0], totals[1], totals[2]
+
+
+def replay_season(season, batch_size=100000):
+    """
+    Replays the ScoreChange log for one season. Totals are clamped at zero,
+    same as in Player.save(). Players without ScoreChanges in the season are skipped.
+
+    :return: {player_id: (ladder_mmr, score)}, same as PlayerManager.season_totals()
+    """
+    mmr, score, changes = replay_totals(batch_size, season)
+    if season >= changes.shape[0]:
+        return {}
+
+    mmr = np.maximum(mmr[season], 0)
+    score = np.maximum(score[season], 0)
+
+    return {
+        int(player_id): (int(mmr[player_id]), int(score[player_id]))
+        for player_id in np.flatnonzero(changes[season])
+    }
@@ -1,28 +1,62 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.db.models import Sum
 
-from app.ladder.models import ScoreChange, Match, Player, LadderSettings, QueuePlayer, LadderQueue
+from app.ladder.managers import ladder_updated
+from app.ladder.models import ScoreChange, Match, Player, LadderSettings, QueuePlayer, LadderQueue, \
+    PlayerSeasonStats, PlayerPairStats, PlayerReport
+from app.ladder.page_cache import bump_on_commit
+from app.ladder.ranks import ladder_ranks, ranks_changed
+from app.ladder.snapshots import schedule_snapshots
 
 
 @receiver([post_save, post_delete], sender=ScoreChange)
-def score_change(instance, **kwargs):
+def score_change(instance, signal, **kwargs):
     player = instance.player
 
-    season = LadderSettings.get_solo().current_season
-    vals = player.scorechange_set.filter(season=season).aggregate(
-        Sum('mmr_change'), Sum('score_change'))
+    ladder = LadderSettings.get_solo()
+    season = ladder.current_season
 
-    player.ladder_mmr = vals['mmr_change__sum']
-    player.score = vals['score_change__sum']
+    created = kwargs.get('created', False)
+    deleted = signal is post_delete
 
-    player.save()
+    if ladder.incremental_scores and (created or deleted):
+        # apply only this change to totals;
+        # edited changes are summed again below, we don't know old values
+        if instance.season == season:
+            Player.objects.apply_score_changes([instance], -1 if deleted else 1)
+            player.refresh_from_db(fields=['ladder_mmr', 'score'])
+    else:
+        vals = player.scorechange_set.filter(season=season).aggregate(
+            Sum('mmr_change'), Sum('score_change'))
+
+        player.ladder_mmr = vals['mmr_change__sum']
+        player.score = vals['score_change__sum']
+
+        player.save()
+
+    if not created and not deleted:
+        # edited change doesn't look new to rank indexes of other processes
+        ranks_changed()
+    ladder_ranks.player_changed(player, season)
+
+
+@receiver(pre_delete, sender=Match)
+def match_delete(instance, **kwargs):
+    # remember players and their results before MatchPlayers are deleted
+    instance.match_players = PlayerPairStats.objects.match_players(instance)
 
 
 @receiver(post_delete, sender=Match)
-def match_change(**kwargs):
+def match_change(instance, **kwargs):
     Player.objects.update_ranks()
 
+    # streaks can't be undone, so stats of match players are computed again
+    match_players = getattr(instance, 'match_players', [])
+    PlayerSeasonStats.objects.rebuild(instance.season, [mp[0] for mp in match_players])
+    PlayerPairStats.objects.remove_match(match_players, instance.winner)
+
 
 @receiver(post_delete, sender=QueuePlayer)
 def qplayer_change(instance, **kwargs):
@@ -39,3 +73,69 @@ def qplayer_change(instance, **kwargs):
 
     if queue.players.count() < 1:
         queue.delete()
+
+
+# versions of cached pages (page_cache.py) and static snapshots (snapshots.py)
+
+@receiver(post_save, sender=Match)
+def match_saved(instance, **kwargs):
+    # players are added to a new match later in the same transaction
+    def bump():
+        player_ids = instance.matchplayer_set.values_list('player_id', flat=True)
+        bump_on_commit('ladder', *[f'player_{player_id}' for player_id in player_ids])
+
+    transaction.on_commit(bump)
+    schedule_snapshots()
+
+
+@receiver(post_delete, sender=Match)
+def match_deleted(instance, **kwargs):
+    match_players = getattr(instance, 'match_players', [])
+    bump_on_commit('ladder', *[f'player_{mp[0]}' for mp in match_players])
+    schedule_snapshots()
+
+
+@receiver([post_save, post_delete], sender=ScoreChange)
+def score_change_saved(instance, **kwargs):
+    bump_on_commit('ladder', f'player_{instance.player_id}')
+
+
+# player fields shown on ladder pages of other players (lists, matches, stats)
+listed_fields = ('name', 'slug', 'dota_mmr', 'ladder_mmr', 'score', 'rank_ladder_mmr', 'rank_score')
+
+
+def listed_values(player):
+    # deferred fields are not loaded just for this
+    return tuple(player.__dict__.get(field) for field in listed_fields)
+
+
+@receiver(post_init, sender=Player)
+def player_loaded(instance, **kwargs):
+    instance.listed_values = listed_values(instance)
+
+
+@receiver([post_save, post_delete], sender=Player)
+def player_saved(instance, signal, **kwargs):
+    created = kwargs.get('created', False)
+    if signal is post_delete or created or instance.listed_values != listed_values(instance):
+        bump_on_commit('ladder', f'player_{instance.id}')
+    else:
+        bump_on_commit(f'player_{instance.id}')
+
+    instance.listed_values = listed_values(instance)
+
+
+@receiver([post_save, post_delete], sender=PlayerReport)
+def report_saved(instance, **kwargs):
+    bump_on_commit(f'player_{instance.to_player_id}')
+
+
+@receiver(post_save, sender=LadderSettings)
+def settings_saved(**kwargs):
+    bump_on_commit('settings')
+    schedule_snapshots()
+
+
+@receiver(ladder_updated)
+def ranks_updated(**kwargs):
+    bump_on_commit('ladder')
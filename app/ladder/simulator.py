@@ -0,0 +1,170 @@
+import itertools
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# parameters of MatchManager.add_scores()
+RatingParams = namedtuple('RatingParams', [
+    'mmr_per_game',
+    'underdog_diff',
+    'underdog_bonus',
+    'underdog_bonus_max',
+    'use_boundary',
+])
+
+# mmr boundaries around initial mmr, same as in PlayerManager.init_score()
+boundary = 1000
+
+
+def params_grid(**values):
+    """
+    All combinations of given parameter values.
+    Example: params_grid(mmr_per_game=[25, 50], underdog_diff=[150], ...)
+    """
+    names = RatingParams._fields
+    return [RatingParams(*combination) for combination in itertools.product(*(values[n] for n in names))]
+
+
+def load_season(season):
+    """
+    Loads recorded matches of a season into arrays.
+
+    :return: dict with
+        - players: player names, index in this list is player index
+        - initial_mmr: mmr of each player at their first match in the season
+        - teams: M x 10 player indexes, first 5 are team 0
+        - winner: M winning teams
+    """
+    from app.ladder.models import Match
+
+    index = {}
+    initial_mmr = []
+    teams = []
+    winner = []
+
+    matches = Match.objects.filter(season=season, balance__isnull=False)\
+        .select_related('balance').order_by('id')
+    for match in matches.iterator():
+        players = [p for team in match.balance.teams for p in team['players']]
+        if len(players) != 10:
+            continue
+
+        for name, mmr in players:
+            if name not in index:
+                index[name] = len(index)
+                initial_mmr.append(mmr)
+
+        teams.append([index[name] for name, _ in players])
+        winner.append(match.winner)
+
+    return {
+        'players': list(index),
+        'initial_mmr': np.array(initial_mmr, dtype=np.int64),
+        'teams': np.array(teams, dtype=np.int64).reshape(-1, 10),
+        'winner': np.array(winner, dtype=np.int64),
+    }
+
+
+def simulate(season_data, params_list):
+    """
+    Replays season matches under each of parameter sets at once
+    (ratings of all sets are rows of one array).
+
+    Before each match, team with higher mmr is predicted to win
+    (equal mmr counts as a wrong prediction).
+
+    :return: (K x P final ratings, K numbers of correctly predicted winners)
+    """
+    teams, winner = season_data['teams'], season_data['winner']
+    initial_mmr = season_data['initial_mmr']
+
+    params = {
+        name: np.array([getattr(p, name) for p in params_list], dtype=np.int64)
+        for name in RatingParams._fields
+    }
+
+    ratings = np.tile(initial_mmr, (len(params_list), 1))
+    correct = np.zeros(len(params_list), dtype=np.int64)
+
+    for players, won in zip(teams, winner):
+        team_mmr = ratings[:, players].reshape(-1, 2, 5).sum(axis=2) // 5
+        mmr_diff = team_mmr[:, 0] - team_mmr[:, 1]
+
+        correct += (mmr_diff > 0) if won == 0 else (mmr_diff < 0)
+
+        underdog = (mmr_diff > 0).astype(np.int64)
+        bonus = np.minimum(params['underdog_bonus_max'],
+                           np.abs(mmr_diff) // params['underdog_diff'] * params['underdog_bonus'])
+
+        for team in (0, 1):
+            is_victory = 1 if team == won else -1
+            is_underdog = np.where(underdog == team, 1, -1)
+            change = params['mmr_per_game'] * is_victory + bonus * is_underdog
+
+            team_players = players[team * 5:team * 5 + 5]
+            new_mmr = ratings[:, team_players] + change[:, None]
+
+            bounded = params['use_boundary'].astype(bool)
+            low = initial_mmr[team_players] - boundary
+            high = initial_mmr[team_players] + boundary
+            new_mmr[bounded] = np.clip(new_mmr[bounded], low, high)
+
+            ratings[:, team_players] = np.maximum(new_mmr, 0)
+
+    return ratings, correct
+
+
+def ranks(ratings):
+    """
+    Ranks of players in each row, equal ratings share a rank (1, 1, 3).
+    """
+    ordered = np.sort(ratings, axis=1)
+    return np.stack([
+        1 + ratings.shape[1] - np.searchsorted(row_sorted, row, side='right')
+        for row_sorted, row in zip(ordered, ratings)
+    ])
+
+
+def _simulate_chunk(args):
+    return simulate(*args)
+
+
+def run_grid(season_data, params_list, baseline, workers=None):
+    """
+    Simulates all parameter sets, split between worker processes.
+
+    :param baseline: parameter set rank churn is measured against
+    :return: list of result dicts in params_list order
+    """
+    params_list = [baseline] + list(params_list)
+
+    workers = workers or 1
+    chunks = [params_list[i::workers] for i in range(workers)]
+    chunks = [c for c in chunks if c]
+
+    with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+        parts = list(pool.map(_simulate_chunk, [(season_data, chunk) for chunk in chunks]))
+
+    # put rows back in params_list order
+    ratings = np.empty((len(params_list), len(season_data['initial_mmr'])), dtype=np.int64)
+    correct = np.empty(len(params_list), dtype=np.int64)
+    for i, (chunk_ratings, chunk_correct) in enumerate(parts):
+        ratings[i::len(chunks)] = chunk_ratings
+        correct[i::len(chunks)] = chunk_correct
+
+    all_ranks = ranks(ratings)
+    matches = max(len(season_data['winner']), 1)
+
+    return [
+        {
+            'params': params,
+            'mean': float(ratings[i].mean()),
+            'std': float(ratings[i].std()),
+            'percentiles': np.percentile(ratings[i], [10, 50, 90]).tolist(),
+            'churn': float(np.abs(all_ranks[i] - all_ranks[0]).mean()),
+            'accuracy': float(correct[i] / matches),
+        }
+        for i, params in enumerate(params_list)
+    ][1:]
@@ -0,0 +1,139 @@
+import datetime
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.urlresolvers import resolve, reverse
+from django.db import transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+
+# Leaderboard pages and their data rendered to files by run_jobs after matches.
+# Served at /snapshots/<file> by a plain view (views.snapshot_file) that doesn't
+# touch the database, or directly by the front web server if there is one.
+snapshots_dir = os.path.join(settings.BASE_DIR, 'snapshots')
+
+snapshot_pages = [
+    ('ladder:player-list', 'players.html'),
+    ('ladder:player-list-score', 'players-successful.html'),
+    ('ladder:stats', 'stats.html'),
+]
+
+
+def write_atomic(path, content, mtime=None):
+    """
+    Writes file next to the target and renames it over the target,
+    so readers see either the old or the new file, never a partial one.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        if mtime is not None:
+            os.utime(tmp_path, (mtime, mtime))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def render_page(url_name):
+    """
+    Renders a ladder page the same way it's rendered for an anonymous visitor.
+    """
+    path = reverse(url_name)
+    request = RequestFactory().get(path)
+    request.user = AnonymousUser()
+    request.resolver_match = resolve(path)
+
+    view = request.resolver_match
+    response = view.func(request, *view.args, **view.kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+
+    return response.content
+
+
+def leaderboard_data():
+    from app.ladder.models import LadderSettings, PlayerSeasonStats
+
+    season = LadderSettings.get_solo().current_season
+    stats = PlayerSeasonStats.objects.filter(season=season)\
+        .select_related('player').order_by('player__rank_ladder_mmr', 'player__name')
+
+    return {
+        'season': season,
+        'players': [
+            {
+                'name': s.player.name,
+                'slug': s.player.slug,
+                'rank_ladder_mmr': s.player.rank_ladder_mmr,
+                'rank_score': s.player.rank_score,
+                'ladder_mmr': s.player.ladder_mmr,
+                'score': s.player.score,
+                'dota_mmr': s.player.dota_mmr,
+                'matches': s.matches,
+                'wins': s.wins,
+                'losses': s.losses,
+                'streak': s.streak,
+                'last_played': s.last_played,
+            }
+            for s in stats
+        ],
+    }
+
+
+def stats_data():
+    from app.ladder.models import LadderSettings, Match
+    from app.ladder.views import LadderStats
+
+    season = LadderSettings.get_solo().current_season
+    last_days = timezone.now() - datetime.timedelta(days=3)
+
+    return {
+        'season': season,
+        'all_time': LadderStats.get_stats(Match.objects.all()),
+        'this_season': LadderStats.get_stats(Match.objects.filter(season=season)),
+        'last_days': LadderStats.get_stats(Match.objects.filter(date__gte=last_days)),
+    }
+
+
+def render_snapshots():
+    """
+    Renders leaderboard pages to html files and their data to json files.
+    :return: list of written file names
+    """
+    os.makedirs(snapshots_dir, exist_ok=True)
+
+    # files get the time rendering started, data changed after that makes them outdated
+    started = time.time()
+
+    files = {filename: render_page(url_name) for url_name, filename in snapshot_pages}
+
+    generated = timezone.now()
+    for filename, data in [('players.json', leaderboard_data()), ('stats.json', stats_data())]:
+        data['generated'] = generated
+        files[filename] = json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+    for filename, content in files.items():
+        write_atomic(os.path.join(snapshots_dir, filename), content, started)
+
+    return list(files)
+
+
+def schedule_snapshots():
+    """
+    Renders snapshots again after current transaction is committed.
+    Matches recorded close to each other share one render, see JobManager.
+    """
+    from app.ladder.models import Job
+    from app.ladder.managers import JobManager
+
+    transaction.on_commit(lambda: Job.objects.enqueue(
+        Job.RENDER_SNAPSHOTS, delay=JobManager.coalesce_window, coalesce=True))
@@ -0,0 +1,206 @@
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+
+from app.balancer.models import BalanceAnswer
+from app.ladder.managers import MatchManager, JobManager
+from app.ladder.models import LadderSettings, Player, Match, ScoreChange, PlayerSeasonStats, PlayerPairStats, Job
+
+
+def create_players():
+    return [Player.objects.create(name=f'player{i}', dota_mmr=3000 + i * 100) for i in range(10)]
+
+
+def create_answer(teams):
+    return BalanceAnswer.objects.create(
+        teams=[
+            {
+                'players': [[p.name, p.ladder_mmr] for p in team],
+                'mmr': sum(p.ladder_mmr for p in team) // 5,
+            }
+            for team in teams
+        ],
+        mmr_diff=0,
+        mmr_diff_exp=0,
+    )
+
+
+class RecordBalanceTest(TestCase):
+    def setUp(self):
+        LadderSettings.get_solo()
+
+        players = create_players()
+        self.answer = create_answer([players[:5], players[5:]])
+
+    def test_query_count(self):
+        # players, match, match players, score changes, totals and read models
+        # are saved with a fixed number of statements
+        with self.assertNumQueries(23):
+            match = MatchManager.record_balance(self.answer, 0, save_ranks=False)
+
+        self.assertEqual(Match.objects.count(), 1)
+        self.assertEqual(ScoreChange.objects.filter(match__match=match).count(), 10)
+        self.assertEqual(PlayerSeasonStats.objects.filter(season=match.season).count(), 10)
+        self.assertEqual(PlayerPairStats.objects.count(), 90)
+
+        winner = Player.objects.get(name='player0')
+        self.assertEqual(winner.score, 26)
+
+
+class JobManagerTest(TestCase):
+    def setUp(self):
+        LadderSettings.get_solo()
+
+        players = create_players()
+        self.answer = create_answer([players[:5], players[5:]])
+
+    def run_due(self):
+        Job.objects.update(run_after=timezone.now())
+        return Job.objects.run_pending()
+
+    def test_record_match(self):
+        Job.objects.record_match(self.answer, 0)
+        Job.objects.record_match(self.answer, 1)
+
+        self.assertEqual(Job.objects.run_pending(), 2)
+        self.assertEqual(Match.objects.count(), 2)
+        self.assertEqual(Job.objects.filter(kind=Job.RECORD_MATCH, status=Job.DONE).count(), 2)
+
+        # both matches share one ranks update
+        ranks = Job.objects.get(kind=Job.UPDATE_RANKS)
+        self.assertEqual(ranks.status, Job.PENDING)
+        self.assertGreater(ranks.run_after, timezone.now())
+
+    def test_coalesce(self):
+        job = Job.objects.enqueue(Job.UPDATE_RANKS, coalesce=True)
+        self.assertEqual(Job.objects.enqueue(Job.UPDATE_RANKS, coalesce=True), job)
+        self.assertNotEqual(Job.objects.enqueue(Job.UPDATE_RANKS), job)
+
+        # jobs that already ran are not reused
+        Job.objects.update(status=Job.DONE)
+        self.assertNotEqual(Job.objects.enqueue(Job.UPDATE_RANKS, coalesce=True), job)
+        self.assertEqual(Job.objects.count(), 3)
+
+    def test_retry(self):
+        job = Job.objects.enqueue(Job.RECORD_MATCH, {'answer': 0, 'winner': 0, 'dota_id': None})
+
+        for attempt in range(1, JobManager.max_attempts + 1):
+            self.assertEqual(self.run_due(), 1)
+
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            self.assertIn('DoesNotExist', job.error)
+            self.assertEqual(job.locked_by, '')
+            if attempt < JobManager.max_attempts:
+                # not due until retry delay passes
+                self.assertEqual(job.status, Job.PENDING)
+                self.assertEqual(Job.objects.run_pending(), 0)
+
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(self.run_due(), 0)
+
+    def test_lease(self):
+        now = timezone.now()
+        lost = Job.objects.create(kind=Job.UPDATE_RANKS, status=Job.RUNNING, run_after=now,
+                                  locked_by='dead:1', started=now - JobManager.lease_timeout * 2)
+        alive = Job.objects.create(kind=Job.UPDATE_RANKS, status=Job.RUNNING, run_after=now,
+                                   locked_by='alive:1', started=now - datetime.timedelta(seconds=5))
+
+        Job.objects.recover()
+
+        lost.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((lost.status, lost.locked_by, lost.started), (Job.PENDING, '', None))
+        self.assertEqual((alive.status, alive.locked_by), (Job.RUNNING, 'alive:1'))
+
+        # job taken over by another runner is not run
+        Job.objects.run(alive, 'other:1')
+        alive.refresh_from_db()
+        self.assertEqual((alive.status, alive.attempts), (Job.RUNNING, 0))
+
+        self.assertEqual(Job.objects.run_pending('runner:1'), 1)
+        lost.refresh_from_db()
+        self.assertEqual((lost.status, lost.attempts), (Job.DONE, 1))
+
+
+class SeasonStatsTest(TestCase):
+    def setUp(self):
+        LadderSettings.get_solo()
+        self.players = create_players()
+
+    def record(self, teams, winner):
+        return MatchManager.record_balance(create_answer(teams), winner, save_ranks=False)
+
+    @staticmethod
+    def stats():
+        return list(PlayerSeasonStats.objects.order_by('player_id').values_list(
+            'player_id', 'season', 'matches', 'wins', 'losses',
+            'streak', 'best_streak', 'worst_streak', 'last_played'))
+
+    def test_record_delete(self):
+        p = self.players
+        self.record([p[:5], p[5:]], 0)
+        self.record([p[:5], p[5:]], 0)
+        before = self.stats()
+
+        # other teams, so streaks of teammates go different ways
+        match = self.record([p[::2], p[1::2]], 1)
+
+        s = PlayerSeasonStats.objects.get(player=p[0])
+        self.assertEqual((s.matches, s.wins, s.losses), (3, 2, 1))
+        self.assertEqual((s.streak, s.best_streak, s.worst_streak), (-1, 2, 1))
+        s = PlayerSeasonStats.objects.get(player=p[1])
+        self.assertEqual((s.streak, s.best_streak, s.worst_streak), (3, 3, 0))
+
+        # incremental stats are the same as computed from scratch
+        after = self.stats()
+        PlayerSeasonStats.objects.rebuild(match.season)
+        self.assertEqual(self.stats(), after)
+
+        match.delete()
+        self.assertEqual(self.stats(), before)
+
+        Match.objects.all().delete()
+        self.assertEqual(self.stats(), [])
+
+
+class PairStatsTest(TestCase):
+    def setUp(self):
+        LadderSettings.get_solo()
+        self.players = create_players()
+
+    def record(self, teams, winner):
+        return MatchManager.record_balance(create_answer(teams), winner, save_ranks=False)
+
+    @staticmethod
+    def stats():
+        return list(PlayerPairStats.objects.order_by('player_id', 'other_id', 'same_team').values_list(
+            'player_id', 'other_id', 'same_team', 'matches', 'wins', 'mmr_change', 'score_change', 'last_played'))
+
+    def test_record_delete(self):
+        p = self.players
+        self.record([p[:5], p[5:]], 0)
+        self.record([p[:5], p[5:]], 1)
+        before = self.stats()
+
+        # some teammates become opponents, their pairs are new
+        match = self.record([p[::2], p[1::2]], 1)
+
+        pair = PlayerPairStats.objects.get(player=p[0], other=p[2], same_team=True)
+        self.assertEqual((pair.matches, pair.wins), (3, 1))
+        pair = PlayerPairStats.objects.get(player=p[0], other=p[1], same_team=False)
+        self.assertEqual((pair.matches, pair.wins), (1, 0))
+        self.assertEqual(pair.last_played, Match.objects.get(id=match.id).date)
+
+        # incremental pairs are the same as computed from scratch
+        after = self.stats()
+        PlayerPairStats.objects.rebuild()
+        self.assertEqual(self.stats(), after)
+
+        match.delete()
+        self.assertEqual(self.stats(), before)
+        self.assertFalse(PlayerPairStats.objects.filter(player=p[0], other=p[1], same_team=False).exists())
+
+        Match.objects.all().delete()
+        self.assertEqual(self.stats(), [])
@@ -1,4 +1,5 @@
-from app.ladder.views import PlayerList, PlayersSuccessful, MatchList, LadderStats, LobbyStatus, KimerStats
+from app.ladder.views import PlayerList, PlayersSuccessful, MatchList, LadderStats, LobbyStatus, KimerStats, \
+    snapshot_file
 from app.ladder.views import PlayerOverview, PlayerScores, PlayerTeammates, PlayerOpponents
 from app.ladder.views import PlayerAutocomplete
 from django.conf.urls import url
@@ -18,6 +19,7 @@ urlpatterns = [
     url(r'^matches/$', MatchList.as_view(), name='match-list'),
 
     url(r'^stats/$', LadderStats.as_view(), name='stats'),
+    url(r'^snapshots/(?P<filename>[-\w]+\.(?:html|json))$', snapshot_file, name='snapshot'),
     url(r'^lobby-status/$', LobbyStatus.as_view(), name='lobby-status'),
     url(r'^kimer-stats/$', KimerStats.as_view(), name='kimer-stats'),
 ]
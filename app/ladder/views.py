@@ -1,30 +1,27 @@
-from collections import defaultdict
 from decimal import Decimal
 from datetime import timedelta, timezone
 from django.utils import timezone as DjangoTimezone
 from django.core.cache import cache
 import itertools
-from app.ladder.models import Player, MatchPlayer, Match, LadderSettings, PlayerReport
+from app.ladder.analytics import balance_quality
+from app.ladder.page_cache import CachedPageMixin
+from app.ladder.snapshots import snapshots_dir
+from app.ladder.models import Player, MatchPlayer, Match, LadderSettings, PlayerReport, PlayerPairStats
 from dal import autocomplete
-from django.db.models import Max, Count, Prefetch, Case, When, F, ExpressionWrapper, FloatField, Avg
+from django.db.models import Max, Count, Prefetch, F, ExpressionWrapper, FloatField, Avg
 from django.utils.datetime_safe import datetime
 from django.views.generic import ListView, DetailView, TemplateView
-from pure_pagination import Paginator
+from django.views.static import serve
 
 
-class PlayerList(ListView):
+class PlayerList(CachedPageMixin, ListView):
     model = Player
 
     def get_queryset(self):
         qs = super(PlayerList, self).get_queryset()
 
         season = LadderSettings.get_solo().current_season
-        qs = qs.filter(matchplayer__match__season=season).distinct()\
-            .prefetch_related(Prefetch(
-                'matchplayer_set',
-                queryset=MatchPlayer.objects.select_related('match'),
-                to_attr='matches'
-            ))
+        qs = qs.filter(playerseasonstats__season=season)
         return qs
 
     def get_context_data(self, **kwargs):
@@ -32,12 +29,9 @@ class PlayerList(ListView):
         players = context['player_list']
 
         players = players.annotate(
-            match_count=Count('matchplayer'),
-            wins=Count(Case(
-                When(
-                    matchplayer__team=F('matchplayer__match__winner'), then=1)
-                )
-            ),
+            match_count=F('playerseasonstats__matches'),
+            wins=F('playerseasonstats__wins'),
+            last_played=F('playerseasonstats__last_played'),
             winrate=ExpressionWrapper(
                 F('wins') * Decimal('100') / F('match_count'),
                 output_field=FloatField()
@@ -69,7 +63,7 @@ class PlayerList(ListView):
 
 
 # TODO: inherit PlayersBest and PlayersSuccessful from PlayerList
-class PlayersSuccessful(ListView):
+class PlayersSuccessful(CachedPageMixin, ListView):
     model = Player
     template_name = 'ladder/player_list_score.html'
 
@@ -77,12 +71,7 @@ class PlayersSuccessful(ListView):
         qs = super(PlayersSuccessful, self).get_queryset()
 
         season = LadderSettings.get_solo().current_season
-        qs = qs.filter(matchplayer__match__season=season).distinct()\
-            .prefetch_related(Prefetch(
-                'matchplayer_set',
-                queryset=MatchPlayer.objects.select_related('match'),
-                to_attr='matches'
-            ))
+        qs = qs.filter(playerseasonstats__season=season)
         return qs
 
     def get_context_data(self, **kwargs):
@@ -90,13 +79,10 @@ class PlayersSuccessful(ListView):
         players = context['player_list']
 
         players = players.annotate(
-            match_count=Count('matchplayer'),
-            wins=Count(Case(
-                When(
-                    matchplayer__team=F('matchplayer__match__winner'), then=1)
-                )
-            ),
-            losses=F('match_count') - F('wins'),
+            match_count=F('playerseasonstats__matches'),
+            wins=F('playerseasonstats__wins'),
+            losses=F('playerseasonstats__losses'),
+            last_played=F('playerseasonstats__last_played'),
         )
 		
         if not players:
@@ -127,11 +113,21 @@ class PlayersSuccessful(ListView):
 
 # This view is used as a base class for other views,
 # it is not used directly
-class PlayerDetail(DetailView):
+class PlayerDetail(CachedPageMixin, DetailView):
     model = Player
     context_object_name = 'player'
     slug_field = 'slug__iexact'
 
+    def page_versions(self):
+        player_id = Player.objects.filter(slug__iexact=self.kwargs['slug'])\
+            .values_list('id', flat=True).first()
+        if player_id is None:
+            return None
+
+        # score history bars are scaled by ladder-wide maximums,
+        # so matches of other players change this page too
+        return ['settings', 'ladder', f'player_{player_id}']
+
     def get_object(self, queryset=None):
         player = super(PlayerDetail, self).get_object(queryset)
 
@@ -198,52 +194,40 @@ class PlayerDetail(DetailView):
 
         return score_changes
 
-    def teammates_stats(self, matches_min=3, opponents=False):
+    def teammates_stats(self, matches_min=3, opponents=False, limit=None):
+        """
+        Teammates ordered by player's mmr change with them, best first,
+        or opponents ordered by player's mmr change against them, worst first.
+        """
         player = self.object
 
-        matches = player.matchplayer_set\
-            .select_related('match', 'scorechange')\
-            .prefetch_related(Prefetch(
-                'match__matchplayer_set',
-                queryset=MatchPlayer.objects.select_related('player')
-            ))
-
-        # gather initial teammate stats
-        teammates = defaultdict(lambda: defaultdict(int))
-        for matchPlayer in matches:
-            match = matchPlayer.match
-            changes = matchPlayer.scorechange
-            for mp in match.matchplayer_set.all():  # all players for this match
-                if mp.player == player or \
-                   mp.team == matchPlayer.team and opponents or \
-                   mp.team != matchPlayer.team and not opponents:
-                    continue  # this is us, or not our teammate/opponent
-
-                teammate = teammates[mp.player.name]
-                teammate['match_count'] += 1
-                teammate['wins'] += 1 if match.winner == matchPlayer.team else 0
-                teammate['mmr_change'] += changes.mmr_change
-                teammate['score_change'] += changes.score_change
-
-                teammate['last_played'] = mp.match.date if not teammate['last_played'] \
-                    else max(mp.match.date, teammate['last_played'])
-
-        # calc additional teammate stats
-        matches_max = 0
-        if teammates:
-            matches_max = max(t['match_count'] for t in teammates.values())
-
-        for name, teammate in teammates.items():
-            teammate['name'] = name
-            teammate['winrate'] = float(teammate['wins']) / teammate['match_count'] * 100
-            teammate['matches_percent'] = float(teammate['match_count']) / matches_max * 100
-
-        teammates = sorted(teammates.values(), key=lambda x: -x['mmr_change'])
-        return [t for t in teammates if t['match_count'] >= matches_min]
+        pairs = PlayerPairStats.objects.filter(player=player, same_team=not opponents)
+        matches_max = pairs.aggregate(Max('matches'))['matches__max']
+
+        pairs = pairs.filter(matches__gte=matches_min)\
+            .select_related('other')\
+            .order_by('mmr_change' if opponents else '-mmr_change')
+        if limit:
+            pairs = pairs[:limit]
+
+        return [
+            {
+                'name': pair.other.name,
+                'match_count': pair.matches,
+                'wins': pair.wins,
+                'mmr_change': pair.mmr_change,
+                'score_change': pair.score_change,
+                'last_played': pair.last_played,
+                'winrate': float(pair.wins) / pair.matches * 100,
+                'matches_percent': float(pair.matches) / matches_max * 100,
+            }
+            for pair in pairs
+        ]
 
 
 class PlayerOverview(PlayerDetail):
     template_name = 'ladder/player_overview.html'
+    max_age = 3600  # reports are shown a day after they were made
 
     def get_context_data(self, **kwargs):
         self.add_matches_data()
@@ -263,8 +247,8 @@ class PlayerOverview(PlayerDetail):
 
         context.update({
             'score_changes': self.score_history()[:10],
-            'teammates': self.teammates_stats()[:5],
-            'opponents': reversed(self.teammates_stats(opponents=True)[-5:]),
+            'teammates': self.teammates_stats(limit=5),
+            'opponents': self.teammates_stats(opponents=True, limit=5),
             'reports': reports,
             'tips': tips,
         })
@@ -286,7 +270,6 @@ class PlayerTeammates(PlayerDetail):
     template_name = 'ladder/player_teammates.html'
 
     def get_context_data(self, **kwargs):
-        self.add_matches_data()
         context = super(PlayerTeammates, self).get_context_data(**kwargs)
         context.update({
             'teammates': self.teammates_stats(),
@@ -298,10 +281,9 @@ class PlayerOpponents(PlayerDetail):
     template_name = 'ladder/player_opponents.html'
 
     def get_context_data(self, **kwargs):
-        self.add_matches_data()
         context = super(PlayerOpponents, self).get_context_data(**kwargs)
         context.update({
-            'opponents': reversed(self.teammates_stats(opponents=True)),
+            'opponents': self.teammates_stats(opponents=True),
         })
         return context
 
@@ -310,28 +292,54 @@ class PlayerAutocomplete(autocomplete.Select2QuerySetView):
     queryset = Player.objects.order_by('name')
 
 
-class MatchList(ListView):
+class MatchList(CachedPageMixin, ListView):
+    """
+    Match history of current season, newest first.
+    Pages are keyset paginated by match id (?before=<id> / ?after=<id>),
+    so any page costs the same as the first one.
+    """
     model = Match
-    ordering = ['-date']
+    context_object_name = 'match_list'
+    page_size = 50
 
     def get_queryset(self):
-        qs = super(MatchList, self).get_queryset()
-
         season = LadderSettings.get_solo().current_season
-        qs = qs.filter(matchplayer__match__season=season).distinct()\
-            .prefetch_related(Prefetch(
-                'matchplayer_set',
-                queryset=MatchPlayer.objects.select_related('match')
-            ))
-        return qs
+        return Match.objects.filter(season=season)
+
+    @staticmethod
+    def cursor(request, name):
+        try:
+            return int(request.GET[name])
+        except (KeyError, ValueError):
+            return None
 
     def get_context_data(self, **kwargs):
         context = super(MatchList, self).get_context_data(**kwargs)
-        matches = context['match_list']
-
-        page_num = self.request.GET.get('page', 1)
-        page = Paginator(matches, 50, request=self.request).page(page_num)
-        matches = page.object_list
+        season_matches = context['match_list']
+
+        # rosters of the whole page in one query, ordered by team and
+        # without MatchPlayer's default ordering that joins matches again
+        matches = season_matches.prefetch_related(Prefetch(
+            'matchplayer_set',
+            queryset=MatchPlayer.objects.select_related('player').order_by('team', 'id')
+        ))
+
+        before = self.cursor(self.request, 'before')
+        after = self.cursor(self.request, 'after')
+
+        # take one extra match to know if there is a page after this one
+        if after is not None:
+            matches = list(matches.filter(id__gt=after).order_by('id')[:self.page_size + 1])
+            has_newer = len(matches) > self.page_size
+            matches = matches[:self.page_size][::-1]
+            has_older = bool(matches) and season_matches.filter(id__lt=matches[-1].id).exists()
+        else:
+            if before is not None:
+                matches = matches.filter(id__lt=before)
+            matches = list(matches.order_by('-id')[:self.page_size + 1])
+            has_older = len(matches) > self.page_size
+            matches = matches[:self.page_size]
+            has_newer = bool(matches) and season_matches.filter(id__gt=matches[0].id).exists()
 
         for match in matches:
             match.radiant = [mp for mp in match.matchplayer_set.all() if mp.team == 0]
@@ -339,14 +347,16 @@ class MatchList(ListView):
 
         context.update({
             'match_list': matches,
-            'pagination': page,
+            'newer_cursor': matches[0].id if has_newer else None,
+            'older_cursor': matches[-1].id if has_older else None,
         })
 
         return context
 
 
-class LadderStats(TemplateView):
+class LadderStats(CachedPageMixin, TemplateView):
     template_name = 'ladder/stats.html'
+    max_age = 3600  # has stats of the last days
 
     def get_context_data(self, **kwargs):
         context = super(LadderStats, self).get_context_data(**kwargs)
@@ -355,10 +365,14 @@ class LadderStats(TemplateView):
         this_season = Match.objects.filter(season=LadderSettings.get_solo().current_season)
         last_days = Match.objects.filter(date__gte=datetime.now() - timedelta(days=3))
 
+        season = LadderSettings.get_solo().current_season
+
         context.update({
             'all_time': self.get_stats(all_time),
             'this_season': self.get_stats(this_season),
             'last_days': self.get_stats(last_days),
+            'balance_season': balance_quality([season]),
+            'balance_all_time': balance_quality(range(1, season + 1)),
         })
         return context
 
@@ -371,6 +385,13 @@ class LadderStats(TemplateView):
         )
 
 
+def snapshot_file(request, filename):
+    # Serves files rendered by snapshots.render_snapshots().
+    # Plain view on purpose: no page cache, no request.user, no database,
+    # so leaderboard stays readable while the database is down.
+    return serve(request, filename, document_root=snapshots_dir)
+
+
 class LobbyStatus(TemplateView):
     template_name = 'ladder/lobby_status.html'
 
@@ -9,4 +9,5 @@ python manage.py migrate --noinput
 # Start inhouse application
 python manage.py runserver 0.0.0.0:8000 &
 python manage.py dota_bot -n 3 &
+python manage.py run_jobs &
 python manage.py discord_bot
\ No newline at end of file